@@ -0,0 +1,286 @@
+import argparse
+import contextlib
+import csv
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS is then not reported
+    resource = None
+
+host_vulnerability_header = ['IP', 'DNS', 'NetBIOS', 'OS', 'IP Status', 'QID', 'Title', 'Type', 'Severity', 'Port',
+                             'Protocol', 'FQDN', 'SSL', 'CVE ID', 'Results', 'Instance', 'Category']
+# Seconds importing compare_csv may take, see measure_import_time
+import_time_target = 0.1
+# Rows of the host vulnerability section per host
+vulnerabilities_per_host = 10
+default_sizes = [1000, 10000, 100000]
+
+
+def _get_host_vulnerability_row(row_no, title_suffix=''):
+    host_no = row_no // vulnerabilities_per_host
+    return [f"10.{host_no // 65536 % 256}.{host_no // 256 % 256}.{host_no % 256}", f"host{host_no}.example.com",
+            f"HOST{host_no}", 'Linux 3.x', 'host scanned, found vuln', str(38000 + row_no % vulnerabilities_per_host),
+            f"Vulnerability {row_no % 997}{title_suffix}", 'Vuln', str(1 + row_no % 5), str(row_no % 65536), 'tcp',
+            '', 'over non ssl', f"CVE-2020-{row_no % 9000 + 1000}",
+            f"Banner line {row_no}\nVersion {row_no % 13}" + ("\n\nDetails" if row_no % 7 == 0 else ''), '', 'General']
+
+
+def _write_summary_sections(csv_writer, host_count, mutate):
+    csv_writer.writerow(['Scan Results', 'Benchmark report'])
+    csv_writer.writerow(['Company', 'Address'])
+    csv_writer.writerow(['Benchmark Inc.', 'Street 1'])
+    csv_writer.writerow([])
+    csv_writer.writerow(["Launch Date", "Active Hosts", "Total Hosts", "Type", "Status", "Reference",
+                         "Scanner Appliance", "Duration", "Scan Title", "Date Range"])
+    csv_writer.writerow(['01/01/2020 10:00:00', str(host_count), str(host_count), 'On demand', 'Finished',
+                         'scan/1', 'appliance', '01:00:00', 'Benchmark scan', '2020-01-02' if mutate else '2020-01-01'])
+    csv_writer.writerow([])
+    csv_writer.writerow(['Asset Groups', 'IPs', 'Active Hosts'])
+    csv_writer.writerow(['Benchmark group', '10.0.0.0-10.255.255.255', str(host_count)])
+    csv_writer.writerow([])
+    csv_writer.writerow(['Total Vulnerabilities', 'Average Security Risk'])
+    csv_writer.writerow([str(host_count * vulnerabilities_per_host), '3.2'])
+    csv_writer.writerow([])
+    csv_writer.writerow(['by Status'])
+    csv_writer.writerow(['Status', 'Confirmed', 'Potential', 'Total'])
+    for status in ['New', 'Active', 'Fixed', 'Re-Opened']:
+        csv_writer.writerow([status, '1', '2', '3'])
+    csv_writer.writerow([])
+    csv_writer.writerow(['by Severity'])
+    csv_writer.writerow(['Severity', 'Confirmed', 'Potential', 'Information Gathered', 'Total'])
+    for severity in range(1, 6):
+        csv_writer.writerow([str(severity), '0', '1', '2', '3'])
+    csv_writer.writerow([])
+    csv_writer.writerow(['IP', 'Network', 'Total Vulnerabilities', 'Security Risk'])
+    for host_no in range(host_count):
+        csv_writer.writerow([_get_host_vulnerability_row(host_no * vulnerabilities_per_host)[0], 'Global Default',
+                             str(vulnerabilities_per_host), '3.0'])
+    csv_writer.writerow([])
+
+
+def generate_report_pair(expected, actual, rows, seed=1, deviation_rate=0.0, missing_rate=0.0, extra_rate=0.0,
+                         reorder_rate=0.0):
+    """
+    This method writes a synthetic Expected and Actual scan report with every section layout get_section_key
+    recognises: scan details, asset groups, total vulnerabilities, status and severity summaries, host summary and
+    a host vulnerability section of the given number of rows. Rows are generated one at a time, so any size can
+    be written in constant memory.
+    :param rows: Number of rows of the host vulnerability section
+    :param deviation_rate: Fraction of host vulnerability rows with a changed cell in Actual report
+    :param missing_rate: Fraction of host vulnerability rows absent in Actual report
+    :param extra_rate: Fraction of host vulnerability rows followed by an extra row in Actual report
+    :param reorder_rate: Fraction of host vulnerability rows swapped with the next row in Actual report
+    :return: Counts of the deviations written
+    """
+    rnd = random.Random(seed)
+    host_count = max(1, (rows + vulnerabilities_per_host - 1) // vulnerabilities_per_host)
+    counts = OrderedDict((name, 0) for name in ['deviations', 'missing', 'extra', 'reordered'])
+    with open(expected, mode='w', newline='') as expected_file, open(actual, mode='w', newline='') as actual_file:
+        expected_writer = csv.writer(expected_file, quoting=csv.QUOTE_ALL)
+        actual_writer = csv.writer(actual_file, quoting=csv.QUOTE_ALL)
+        _write_summary_sections(expected_writer, host_count, False)
+        _write_summary_sections(actual_writer, host_count, True)
+        expected_writer.writerow(host_vulnerability_header)
+        actual_writer.writerow(host_vulnerability_header)
+        held_row = None
+        for row_no in range(rows):
+            expected_writer.writerow(_get_host_vulnerability_row(row_no))
+            if rnd.random() < missing_rate:
+                counts['missing'] += 1
+                continue
+            if rnd.random() < deviation_rate:
+                counts['deviations'] += 1
+                actual_row = _get_host_vulnerability_row(row_no, ' (changed)')
+            else:
+                actual_row = _get_host_vulnerability_row(row_no)
+            if held_row is not None:
+                actual_writer.writerow(actual_row)
+                actual_writer.writerow(held_row)
+                held_row = None
+            elif rnd.random() < reorder_rate:
+                counts['reordered'] += 1
+                held_row = actual_row
+            else:
+                actual_writer.writerow(actual_row)
+            if rnd.random() < extra_rate:
+                counts['extra'] += 1
+                extra_row = _get_host_vulnerability_row(row_no)
+                extra_row[9] = str(65536 + row_no)
+                actual_writer.writerow(extra_row)
+        if held_row is not None:
+            actual_writer.writerow(held_row)
+        for csv_writer in [expected_writer, actual_writer]:
+            csv_writer.writerow([])
+            csv_writer.writerow(['No vulnerabilities match your filters for these hosts'])
+    return counts
+
+
+def _get_peak_rss():
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+def run_benchmark_case(work_dir, rows, seed=1, deviation_rate=0.0, missing_rate=0.0, extra_rate=0.0,
+                       reorder_rate=0.0, validate_options=None):
+    """
+    This method generates one report pair and times the stages of its comparison separately: parse
+    (read_report_sections_in_dict of both reports), keying (key_report_sections), comparison (compare_reports of
+    the keyed sections) and summary writing (write_report_comparison_summary), followed by a run of
+    validate_vm_report with validate_options. Meant to run in a process of its own, so that its peak RSS is
+    that of the case alone.
+    :return: OrderedDict of the case settings, deviations written, seconds per stage and peak RSS in bytes
+    """
+    expected = os.path.join(work_dir, f"expected_{rows}.csv")
+    actual = os.path.join(work_dir, f"actual_{rows}.csv")
+    summary = os.path.join(work_dir, f"summary_{rows}.txt")
+    validate_options = validate_options or {}
+    result = OrderedDict([('rows', rows), ('seed', seed), ('deviation_rate', deviation_rate),
+                          ('missing_rate', missing_rate), ('extra_rate', extra_rate), ('reorder_rate', reorder_rate),
+                          ('validate_options', validate_options)])
+    stages = OrderedDict()
+
+    start_time = time.perf_counter()
+    result['generated'] = generate_report_pair(expected, actual, rows, seed, deviation_rate, missing_rate,
+                                               extra_rate, reorder_rate)
+    stages['generate'] = time.perf_counter() - start_time
+    result['expected_bytes'] = os.path.getsize(expected)
+    result['actual_bytes'] = os.path.getsize(actual)
+
+    # Diagnostics printed by compare_csv are not part of the measurement
+    with open(os.devnull, mode='w') as devnull, contextlib.redirect_stdout(devnull):
+        import compare_csv
+
+        start_time = time.perf_counter()
+        expected_dict = compare_csv.read_report_sections_in_dict(expected)
+        actual_dict = compare_csv.read_report_sections_in_dict(actual)
+        stages['parse'] = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        expected_dict = compare_csv.key_report_sections(expected_dict)
+        actual_dict = compare_csv.key_report_sections(actual_dict)
+        stages['keying'] = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        flag_list, summary_messages = compare_csv.compare_reports(expected_dict, actual_dict)
+        stages['comparison'] = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        compare_csv.write_report_comparison_summary(flag_list, summary_messages, summary)
+        stages['summary'] = time.perf_counter() - start_time
+        del expected_dict, actual_dict, flag_list, summary_messages
+
+        start_time = time.perf_counter()
+        comparison_result = compare_csv.validate_vm_report(expected, actual, summary, **validate_options)
+        stages['validate_vm_report'] = time.perf_counter() - start_time
+
+    result['stages'] = stages
+    result['rows_per_second'] = rows / stages['validate_vm_report'] if stages['validate_vm_report'] > 0 else None
+    result['status'] = bool(comparison_result)
+    result['deviations_found'] = comparison_result.deviation_count
+    result['peak_rss_bytes'] = _get_peak_rss()
+    return result
+
+
+def _get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure_import_time(repeat=5):
+    """
+    This method measures the time importing compare_csv takes in a fresh interpreter, as paid by every worker
+    process and command line run.
+    :return: Fastest of repeat measurements, in seconds
+    """
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    code = 'import time; start_time = time.perf_counter(); import compare_csv; print(time.perf_counter() - start_time)'
+    return min(float(subprocess.run([sys.executable, '-c', code], cwd=package_dir, capture_output=True, text=True,
+                                    check=True).stdout)
+               for _ in range(repeat))
+
+
+def run_benchmark(sizes, work_dir=None, keep_reports=False, **case_options):
+    """
+    This method runs run_benchmark_case for every size, each in a fresh worker process.
+    :param sizes: Row counts of the host vulnerability section, e.g. 1000 to 10000000
+    :param work_dir: Directory of the generated reports, a temporary one if not given
+    :param keep_reports: If True, generated reports and summaries are not removed
+    :param case_options: Further keyword arguments of run_benchmark_case
+    :return: OrderedDict of the environment and the results of every case
+    """
+    temp_dir = None
+    if work_dir is None:
+        work_dir = temp_dir = tempfile.mkdtemp(prefix='compare_csv_benchmark_')
+    os.makedirs(work_dir, exist_ok=True)
+    results = OrderedDict([('commit', _get_commit()), ('python', platform.python_version()),
+                           ('platform', platform.platform()), ('cpu_count', os.cpu_count()),
+                           ('import_seconds', measure_import_time()), ('import_seconds_target', import_time_target),
+                           ('cases', [])])
+    if results['import_seconds'] > import_time_target:
+        print(f"Importing compare_csv took {results['import_seconds']:.3f} s, more than the target of "
+              f"{import_time_target:.3f} s", file=sys.stderr)
+    try:
+        for rows in sizes:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                results['cases'].append(executor.submit(run_benchmark_case, work_dir, rows, **case_options).result())
+            if not keep_reports:
+                for name in os.listdir(work_dir):
+                    if name.endswith(f"_{rows}.csv") or name.endswith(f"_{rows}.txt"):
+                        os.remove(os.path.join(work_dir, name))
+    finally:
+        if temp_dir is not None and not keep_reports:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark compare_csv on synthetic scan reports')
+    parser.add_argument('--sizes', type=int, nargs='+', default=default_sizes,
+                        help='Rows of the host vulnerability section, one case per size')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--deviation-rate', type=float, default=0.01)
+    parser.add_argument('--missing-rate', type=float, default=0.001)
+    parser.add_argument('--extra-rate', type=float, default=0.001)
+    parser.add_argument('--reorder-rate', type=float, default=0.0)
+    parser.add_argument('--workers', type=int, default=1, help='workers of validate_vm_report')
+    parser.add_argument('--memory-budget', type=int, default=None, help='memory_budget of validate_vm_report')
+    parser.add_argument('--work-dir', default=None, help='Directory of the generated reports')
+    parser.add_argument('--keep-reports', action='store_true')
+    parser.add_argument('--output', default=None, help='JSON file of the results, printed if not given')
+    args = parser.parse_args(argv)
+
+    validate_options = {'workers': args.workers}
+    if args.memory_budget is not None:
+        validate_options['memory_budget'] = args.memory_budget
+    results = run_benchmark(args.sizes, args.work_dir, args.keep_reports, seed=args.seed,
+                            deviation_rate=args.deviation_rate, missing_rate=args.missing_rate,
+                            extra_rate=args.extra_rate, reorder_rate=args.reorder_rate,
+                            validate_options=validate_options)
+    if args.output is None:
+        print(json.dumps(results, indent=2))
+    else:
+        with open(args.output, mode='w') as output_file:
+            json.dump(results, output_file, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
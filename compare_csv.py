@@ -1,102 +1,830 @@
+import contextlib
 import csv
+import gzip
+import hashlib
+import io
 import itertools
+import json
+import locale
+import math
+import mmap
 import os
+import pickle
 import re
+import shutil
+import signal
+import sys
+import tempfile
+import time
 import traceback
+import tracemalloc
+import weakref
+from array import array
+from bisect import bisect_left
+from collections import Counter
 from collections import OrderedDict
 from collections import namedtuple
+from collections.abc import Mapping
+from datetime import datetime
+from functools import partial
 from functools import reduce
+from heapq import merge
+from heapq import nsmallest
 from operator import add
-
-SectionMetaData = namedtuple('SectionMetaData', ['section_start', 'header', 'rpt_section'])
+from operator import lt
+from operator import itemgetter
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, stage memory high-water marks are then only reported when tracing with tracemalloc
+    resource = None
+
+SectionMetaData = namedtuple('SectionMetaData',
+                             ['section_start', 'header', 'rpt_section', 'row_line_no', 'digest', 'keyed'],
+                             defaults=[None, None])
+RowPosition = namedtuple('RowPosition', ['position', 'line_no'])
+SectionIndex = namedtuple('SectionIndex', ['section_start', 'header', 'offset', 'record_count', 'digest', 'end'],
+                          defaults=[None, None])
+ReportPair = namedtuple('ReportPair', ['expected', 'actual', 'summary'])
+BatchResult = namedtuple('BatchResult', ['expected', 'actual', 'summary', 'status', 'seconds'])
+# Settings of the record comparison, passed down to worker processes with the section data
+ComparisonOptions = namedtuple('ComparisonOptions', ['compare_backend'], defaults=['python'])
+# Profile of one stage of the comparison, section is the section header string or the report file for whole-report
+# stages; memory_peak is in bytes
+StageRecord = namedtuple('StageRecord', ['stage', 'section', 'seconds', 'rows', 'cells', 'memory_peak'])
+# Record sample of a section compared by quick_check_vm_report: records are counted by record key, confidence is the
+# probability that the sample finds a deviating record if detect_rate of the records of the section deviate
+SectionSample = namedtuple('SectionSample', ['section', 'records', 'sampled_records', 'confidence'])
+# Numbers of passed and failed checks, counted by count_flags like as many True and False flags
+FlagCounts = namedtuple('FlagCounts', ['passed', 'failed'])
 ErrorMsg = namedtuple('ErrorMsg', ['line_no', 'error_msg'])  # , 'column_name', 'expected_value', 'actual_value'
+
+
+class Deviation(namedtuple('Deviation', ['deviation_type', 'section', 'column', 'key', 'expected', 'actual',
+                                         'exp_line_no', 'act_line_no', 'message'],
+                           defaults=[None, None, None, None, None, None, None, None])):
+    """
+    A deviation found when comparing reports. It takes the place of its message in the summary messages, so str()
+    of it is the message written to the Summary file. key is the record key as compared (key column values
+    joined by NUL), expected and actual are the values, counts or records that differ.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return self.message
+
+
+class DuplicateKeyCount(namedtuple('DuplicateKeyCount', ['section', 'exp_records', 'exp_keys', 'act_records',
+                                                         'act_keys', 'message'])):
+    """
+    Number of records sharing a key, and of keys shared, in a section of both reports. Such records are all
+    compared, see pair_duplicate_records; the count itself is not a deviation.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return self.message
+
+
+class DeviationMessage(str):
+    """
+    Summary message of several deviations at once, e.g. of all records of a section absent in one of the reports.
+    """
+
+    def __new__(cls, message, deviations):
+        deviation_message = super().__new__(cls, message)
+        deviation_message.deviations = deviations
+        return deviation_message
+
+    def __reduce__(self):
+        return DeviationMessage, (str(self), self.deviations)
+
+
 success_msg = 'No deviations found in report data'
 failure_msg = 'Deviations observed in report data'
+# Sections with more records than this are split into key-hash partitions when comparing with several workers
+large_section_record_count = 50000
+# Reports larger than this (in bytes) are parsed in chunks, split on blank lines, when reading with several workers
+large_report_size = 64 * 1024 * 1024
+# One value of a raw CSV record, see _get_raw_row_pattern
+_raw_value_pattern = rb'(?:"[^"]*+(?:""[^"]*+)*+(?:"|\Z)[^,\n]*+|[^,\n]*+)'
+# Upper bound (in bytes) of the files kept in a baseline cache directory, least recently used ones are removed first
+baseline_cache_size = 2 * 1024 * 1024 * 1024
+_baseline_cache_version = 5
+_delta_state_version = 4
+# Bytes of Summary file output buffered before it is written to disk
+summary_buffer_size = 1024 * 1024
+# Records of a section compared column by column at once, fewer for sections spilled to disk (see
+# _get_compare_chunk_size)
+compare_chunk_size = 10000
+# Deviations inserted into a DeviationStore file at once
+deviation_store_batch_size = 10000
+skip_columns = ['Date Range']
+# Rows starting with these values are skipped, rows with a cell containing one of the banners are not records
+skip_row_values = ['by Status', 'by Severity']
+no_data_banners = ['No vulnerabilities match your filters for these hosts', 'No results available for these hosts']
+_crlf_pattern = re.compile('\r?\n')
+# Records sharing a key are keyed as key, key + separator + '2', key + separator + '3' and so on, in report order
+_duplicate_key_separator = '\x01'
+_cell_separator_pattern = re.compile('\\s*\x00\\s*')
+compare_backends = ['python', 'numpy']
+# StageProfiler of the running comparison, set by validate_vmcsv_report when profiling is asked for
+stage_profiler = None
+_no_stage_profile = contextlib.nullcontext()
+
+
+class StageCounts:
+    """
+    Rows processed and cells compared in a profiled stage, counted by the code running the stage.
+    """
+    __slots__ = ('rows', 'cells')
+
+    def __init__(self):
+        self.rows = 0
+        self.cells = 0
+
+
+class StageProfiler:
+    """
+    Records wall time, rows processed, cells compared and memory high-water mark of the stages of a comparison, per
+    section for the stages working on one section. The memory high-water mark is the peak of the memory traced by
+    tracemalloc during the stage when tracemalloc is tracing, else the peak RSS of the process so far.
+    """
+
+    def __init__(self):
+        self.stage_records = []
+
+    @contextlib.contextmanager
+    def stage(self, stage, section=None):
+        stage_counts = StageCounts()
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        start_time = time.perf_counter()
+        try:
+            yield stage_counts
+        finally:
+            seconds = time.perf_counter() - start_time
+            memory_peak = tracemalloc.get_traced_memory()[1] if tracing else _get_peak_rss()
+            self.stage_records.append(StageRecord(stage, section, seconds, stage_counts.rows, stage_counts.cells,
+                                                  memory_peak))
+
+
+def profile_stage(stage, section=None):
+    """
+    This method times a stage of the comparison with stage_profiler.
+    :param stage: Name of the stage
+    :param section: Section header string or report file the stage works on
+    :return: Context manager yielding StageCounts to count rows and cells of the stage in, or None when profiling
+             is off
+    """
+    if stage_profiler is None:
+        return _no_stage_profile
+    return stage_profiler.stage(stage, section)
+
+
+def _set_stage_profiler(profiler):
+    global stage_profiler
+    stage_profiler = profiler
+
+
+def _get_peak_rss():
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+def _call_with_stage_profile(function, *args):
+    """
+    This method runs function in a worker process with a StageProfiler of its own.
+    :return: Result of function and the StageRecord list of its stages, to be merged into the profile of the
+             comparison by _get_profiled_result
+    """
+    profiler = StageProfiler()
+    _set_stage_profiler(profiler)
+    try:
+        return function(*args), profiler.stage_records
+    finally:
+        _set_stage_profiler(None)
+
+
+def _get_profiled_result(future_result):
+    if stage_profiler is None:
+        return future_result
+    result, stage_records = future_result
+    stage_profiler.stage_records += stage_records
+    return result
+
+
+def get_stage_profile_messages(stage_records):
+    """
+    This method formats stage records for the Summary file: totals per stage, followed by every stage record.
+    :return: Summary messages of the stage profile
+    """
+    stage_totals = OrderedDict()
+    for record in stage_records:
+        seconds, rows, cells, memory_peak = stage_totals.get(record.stage, (0.0, 0, 0, None))
+        if record.memory_peak is not None:
+            memory_peak = record.memory_peak if memory_peak is None else max(memory_peak, record.memory_peak)
+        stage_totals[record.stage] = (seconds + record.seconds, rows + record.rows, cells + record.cells,
+                                      memory_peak)
+    msg = ["*" * 100]
+    msg += ["Stage profile:"]
+    stage_messages = [f"{stage} | Total | Seconds: {seconds:.6f} | Rows: {rows} | Cells compared: {cells} | "
+                      f"Memory high-water mark: {memory_peak}"
+                      for stage, (seconds, rows, cells, memory_peak) in stage_totals.items()]
+    stage_messages += [f"{record.stage} | Section: [{record.section}] | Seconds: {record.seconds:.6f} | "
+                       f"Rows: {record.rows} | Cells compared: {record.cells} | "
+                       f"Memory high-water mark: {record.memory_peak}"
+                       for record in stage_records]
+    return [msg, stage_messages]
 
 
 def _getRecordCount(vmreport):
     """
-    This method returns count of records from CSV report.
+    This method returns count of records from CSV report, counted over its raw bytes.
     :param vmreport: CSV report
-    :return: boolean
+    :return: Number of CSV records, blank ones included
     """
-    return sum(1 for row in csv.reader(open(vmreport)))
+    if os.path.getsize(vmreport) == 0:
+        return 0
+    with open(vmreport, mode='rb') as csv_file, mmap.mmap(csv_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return sum(1 for match in _get_raw_row_pattern().finditer(data) if match.start() < len(data))
 
 
 def read_report_sections_in_dict(fileName):
+    with profile_stage('read_report_sections_in_dict', fileName) as stage_counts:
+        with open(fileName, mode='r') as csv_file:
+            rpt_section_dict, line_no = _read_report_sections(csv_file)
+        if stage_counts is not None:
+            stage_counts.rows = _count_section_records(rpt_section_dict)
+
+    return rpt_section_dict
+
+
+def _count_section_records(rpt_section_dict):
+    return sum(len(section_meta_data.rpt_section) for section_meta_data in rpt_section_dict.values())
+
+
+def _read_report_sections(csv_file, line_no=1):
     rpt_section_dict = OrderedDict()
 
+    csv_reader = csv.reader(csv_file)
+    section_meta_data = None
+    section_columns = None
+    header_str_key = None
+    for row in csv_reader:
+        if row is None or not row:
+            section_meta_data = None
+        else:
+            if not is_row_skippable(row):
+                if section_meta_data is None:
+                    section_meta_data = create_section_metadata(line_no, row)
+                    section_columns = SectionColumns(row)
+                    # sorted_header = sorted(row)
+                    sorted_header = row
+                    header_str_key = '|'.join(str(column).strip() for column in sorted_header)
+                    rpt_section_dict[header_str_key] = section_meta_data
+
+                if is_row_col_val_conv_req(line_no, row):
+                    row = convert_row_to_col_val(section_columns, row)
+                    section_meta_data.rpt_section.append(row)
+                    section_meta_data.row_line_no.append(line_no)
+
+        line_no += 1
+
+    return rpt_section_dict, line_no
+
+
+def read_report_chunk(fileName, start, end, line_no=1):
+    """
+    This method reads report sections from the byte range [start, end) of a CSV report.
+    :param fileName: CSV report
+    :param start: Byte offset of the chunk, at the beginning of the report or just after a blank line
+    :param end: Byte offset the chunk ends at
+    :param line_no: Line number of the first record of the chunk
+    :return: OrderedDict of sections of the chunk and the line number following the chunk
+    """
+    with open(fileName, mode='rb') as csv_file:
+        csv_file.seek(start)
+        data = csv_file.read(end - start)
+    with io.TextIOWrapper(io.BytesIO(data), encoding=locale.getpreferredencoding(False)) as csv_file:
+        return _read_report_sections(csv_file, line_no)
+
+
+def find_report_chunks(fileName, chunks):
+    """
+    This method splits a CSV report into about equally sized byte ranges that start right after a blank line, i.e.
+    on the same section boundaries read_report_sections_in_dict uses. Records are scanned like
+    _get_raw_row_pattern does, so blank lines inside quoted values are skipped.
+    :param fileName: CSV report
+    :param chunks: Number of chunks wanted
+    :return: List of (start, end) byte offsets
+    """
+    file_size = os.path.getsize(fileName)
+    boundaries = [0]
+    if file_size == 0:
+        return [(0, 0)]
+    rows_pattern = _get_raw_rows_pattern()
+    with open(fileName, mode='rb') as csv_file, mmap.mmap(csv_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        position = 0
+        for chunk_no in range(1, chunks):
+            while True:
+                # Skips the records up to the next blank line, which ends right after its line feed
+                position = rows_pattern.match(data, position).end()
+                if position >= file_size:
+                    break
+                position = data.find(b'\n', position) + 1
+                if position > file_size * chunk_no // chunks:
+                    break
+            if position >= file_size:
+                break
+            boundaries.append(position)
+    boundaries.append(file_size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end]
+
+
+def _merge_report_chunks(chunk_results):
+    """
+    This method joins sections read by read_report_chunk into what read_report_sections_in_dict returns for the
+    whole report. Chunks after the first one were read from line 4 and get their line numbers shifted.
+    """
+    rpt_section_dict = OrderedDict()
     line_no = 1
+    for chunk_no, (chunk_section_dict, chunk_end_line_no) in enumerate(chunk_results):
+        chunk_line_no = 1 if chunk_no == 0 else 4
+        line_shift = line_no - chunk_line_no
+        for header_str_key, section_meta_data in chunk_section_dict.items():
+            if line_shift != 0:
+                section_meta_data.row_line_no[:] = [row_line_no + line_shift
+                                                    for row_line_no in section_meta_data.row_line_no]
+                section_meta_data = section_meta_data._replace(
+                    section_start=section_meta_data.section_start + line_shift)
+            rpt_section_dict[header_str_key] = section_meta_data
+        line_no += chunk_end_line_no - chunk_line_no
+    return rpt_section_dict
 
-    with open(fileName, mode='r') as csv_file:
-        csv_reader = csv.reader(csv_file)
-        section_meta_data = None
-        for row in csv_reader:
-            if row is None or not row:
-                section_meta_data = None
-            else:
-                if not is_row_skippable(row):
-                    if section_meta_data is None:
-                        section_meta_data = create_section_metadata(line_no, row)
-                        # sorted_header = sorted(row)
-                        sorted_header = row
-                        header_str_key = '|'.join(str(column).strip() for column in sorted_header)
-                        rpt_section_dict[header_str_key] = section_meta_data
-
-                    if is_row_col_val_conv_req(line_no, row):
-                        row = convert_row_to_col_val(section_meta_data.header, row)
-                        section_meta_data.rpt_section.append(row)
 
-            line_no += 1
+def _submit_report_read(executor, fileName, chunks):
+    if os.path.getsize(fileName) <= large_report_size:
+        return [executor.submit(read_report_chunk, fileName, 0, os.path.getsize(fileName))]
+    # Records of the first 3 lines are never compared, so later chunks are read as if they start at line 4
+    return [executor.submit(read_report_chunk, fileName, start, end, 1 if start == 0 else 4)
+            for start, end in find_report_chunks(fileName, chunks)]
+
+
+def read_reports_in_parallel(fileNames, workers):
+    """
+    This method reads reports concurrently in a process pool. Reports larger than large_report_size are split by
+    find_report_chunks and their chunks read in parallel as well.
+    :return: List of report sections, as returned by read_report_sections_in_dict, one per report
+    """
+    with _create_process_pool(workers) as executor:
+        pending_reads = [(fileName, _submit_report_read(executor, fileName, workers)) for fileName in fileNames]
+        result = []
+        for fileName, futures in pending_reads:
+            with profile_stage('read_reports_in_parallel', fileName) as stage_counts:
+                chunk_results = [future.result() for future in futures]
+                first_chunk_section_dict, first_chunk_end_line_no = chunk_results[0]
+                if len(chunk_results) > 1 and first_chunk_end_line_no <= 4:
+                    # The first chunk is too short for the later ones to have been read from line 4 onwards
+                    result.append(read_report_sections_in_dict(fileName))
+                else:
+                    result.append(_merge_report_chunks(chunk_results))
+                if stage_counts is not None:
+                    stage_counts.rows = _count_section_records(result[-1])
+    return result
+
 
+def key_report_sections(rpt_section_dict):
+    """
+    This method keys the records of every section with get_data_for_sort_order_validation ahead of the comparison.
+    :return: Sections with SectionMetaData.keyed set to (OrderedDict of key -> record, dict of key -> RowPosition)
+    """
+    keyed_section_dict = OrderedDict()
+    for header_str_key, section_meta_data in rpt_section_dict.items():
+        with profile_stage('get_data_for_sort_order_validation', header_str_key) as stage_counts:
+            lst, odict, index = get_data_for_sort_order_validation(section_meta_data.rpt_section,
+                                                                   section_meta_data.header,
+                                                                   section_meta_data.row_line_no,
+                                                                   section_meta_data.section_start)
+            if stage_counts is not None:
+                stage_counts.rows = len(section_meta_data.rpt_section)
+        keyed_section_dict[header_str_key] = section_meta_data._replace(keyed=(odict, index))
+    return keyed_section_dict
+
+
+def _get_file_content_hash(fileName):
+    hasher = hashlib.sha1()
+    with open(fileName, mode='rb') as report_file:
+        for block in iter(partial(report_file.read, 1024 * 1024), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def read_baseline_report_sections(fileName, cache_dir):
+    """
+    This method returns the sections of a baseline (Expected) report, read and keyed by key_report_sections, from
+    a cache file in cache_dir. The report is read again and the cache rewritten when its size and modification time
+    changed and its content hash does not match the cached one either, or when section_key_specs changed.
+    :param fileName: CSV report
+    :param cache_dir: Directory of the cache files, kept under baseline_cache_size bytes
+    :return: Report sections, as returned by read_report_sections_in_dict, with SectionMetaData.keyed set
+    """
+    file_stat = os.stat(fileName)
+    path_hash = hashlib.sha1(os.path.abspath(fileName).encode('utf-8', 'surrogatepass')).hexdigest()
+    cache_file_name = os.path.join(cache_dir, f"{path_hash}.pickle")
+    content_hash = None
+    try:
+        with open(cache_file_name, mode='rb') as cache_file:
+            version, module_name, key_specs, size, mtime_ns, cached_content_hash = pickle.load(cache_file)
+            # Records are keyed by the column specs of their key columns as well
+            if version == _baseline_cache_version and module_name == __name__ \
+                    and key_specs == (section_key_specs, column_specs) \
+                    and size == file_stat.st_size:
+                if mtime_ns != file_stat.st_mtime_ns:
+                    content_hash = _get_file_content_hash(fileName)
+                if mtime_ns == file_stat.st_mtime_ns or content_hash == cached_content_hash:
+                    rpt_section_dict = pickle.load(cache_file)
+                    # Marks the cache file as recently used
+                    os.utime(cache_file_name)
+                    return rpt_section_dict
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError, AttributeError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"Ignoring baseline cache {cache_file_name}: {e}")
+
+    rpt_section_dict = key_report_sections(read_report_sections_in_dict(fileName))
+    if content_hash is None:
+        content_hash = _get_file_content_hash(fileName)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, temp_file_name = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, mode='wb') as cache_file:
+            pickle.dump((_baseline_cache_version, __name__, (section_key_specs, column_specs), file_stat.st_size,
+                         file_stat.st_mtime_ns, content_hash), cache_file, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(rpt_section_dict, cache_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file_name, cache_file_name)
+        _evict_baseline_cache(cache_dir)
+    except OSError as e:
+        print(f"Could not write baseline cache {cache_file_name}: {e}")
     return rpt_section_dict
 
 
+def _evict_baseline_cache(cache_dir):
+    cache_files = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith('.pickle'):
+            entry_stat = entry.stat()
+            cache_files.append((entry_stat.st_mtime, entry_stat.st_size, entry.path))
+    cache_size = sum(size for mtime, size, path in cache_files)
+    for mtime, size, path in sorted(cache_files):
+        if cache_size <= baseline_cache_size:
+            break
+        os.remove(path)
+        cache_size -= size
+
+
+def _get_delta_state_file_name(expected, actual, delta_state_dir):
+    report_paths = f"{os.path.abspath(expected)}\x00{os.path.abspath(actual)}"
+    return os.path.join(delta_state_dir,
+                        f"{hashlib.sha1(report_paths.encode('utf-8', 'surrogatepass')).hexdigest()}.delta")
+
+
+def _get_delta_state_header(expected_content_hash):
+    return _delta_state_version, __name__, section_key_specs, skip_columns, column_specs, expected_content_hash
+
+
+def read_delta_state(expected, actual, delta_state_dir, expected_content_hash):
+    """
+    This method reads the digest index of the Actual report written by write_delta_state after the previous
+    comparison of the same pair of reports.
+    :param expected_content_hash: Content hash of Expected report, the state is only used if it did not change
+    :return: dict of section header string -> (column header, dict of key -> (row digest, deviations)), empty if
+             there is no usable state
+    """
+    state_file_name = _get_delta_state_file_name(expected, actual, delta_state_dir)
+    try:
+        with open(state_file_name, mode='rb') as state_file:
+            if pickle.load(state_file) == _get_delta_state_header(expected_content_hash):
+                return pickle.load(state_file)
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError, AttributeError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"Ignoring delta state {state_file_name}: {e}")
+    return {}
+
+
+def _get_row_digest(record):
+    cells = record.cells if isinstance(record, ReportRecord) else list(record.values())
+    return hashlib.blake2b('\x00'.join(cells).encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+
+def get_reused_records(actual_dict, delta_state):
+    """
+    This method finds the records of the Actual report unchanged since the comparison delta_state was written
+    for: same section header, key and cells. Against the same Expected report, they compare with the same
+    deviations as then, so only the other records have to be compared again.
+    :param actual_dict: Sections of Actual report, keyed by key_report_sections
+    :param delta_state: Digest index as returned by read_delta_state
+    :return: dict of section header string -> dict of key -> Column_Data_Deviation tuple of the unchanged records,
+             and dict of section header string -> dict of key -> row digest of all records, for write_delta_state
+    """
+    reused_records = {}
+    row_digests = {}
+    for header_str_key, section_meta_data in actual_dict.items():
+        odict_act, index_act = section_meta_data.keyed
+        section_row_digests = {key: _get_row_digest(record) for key, record in odict_act.items()}
+        row_digests[header_str_key] = section_row_digests
+        header, previous_records = delta_state.get(header_str_key, (None, {}))
+        if header == section_meta_data.header:
+            reused_records[header_str_key] = {key: previous_records[key][1]
+                                              for key, row_digest in section_row_digests.items()
+                                              if key in previous_records and previous_records[key][0] == row_digest}
+    return reused_records, row_digests
+
+
+def write_delta_state(expected, actual, delta_state_dir, expected_content_hash, actual_dict, row_digests,
+                      comparison_result):
+    """
+    This method writes the digest index of the Actual report, with the deviations found for every record, for
+    get_reused_records of the next comparison of the same pair of reports.
+    Records of keys shared by several Actual records are left out: their deviations depend on how
+    pair_duplicate_records paired them, not on the record alone. Keys shared by several Expected records are not
+    reused anyway, as the state is only used against the same Expected report.
+    """
+    delta_state = {}
+    for header_str_key, section_row_digests in row_digests.items():
+        section_deviations = {}
+        for deviation in comparison_result.get_deviations(section=header_str_key,
+                                                          deviation_type='Column_Data_Deviation'):
+            section_deviations.setdefault(deviation.key, []).append(deviation)
+        duplicate_keys = {get_record_key(key) for key in section_row_digests if _duplicate_key_separator in key}
+        delta_state[header_str_key] = (actual_dict[header_str_key].header,
+                                       {key: (row_digest, tuple(section_deviations.get(key, ())))
+                                        for key, row_digest in section_row_digests.items()
+                                        if get_record_key(key) not in duplicate_keys})
+    state_file_name = _get_delta_state_file_name(expected, actual, delta_state_dir)
+    try:
+        os.makedirs(delta_state_dir, exist_ok=True)
+        fd, temp_file_name = tempfile.mkstemp(dir=delta_state_dir, suffix='.tmp')
+        with os.fdopen(fd, mode='wb') as state_file:
+            pickle.dump(_get_delta_state_header(expected_content_hash), state_file, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(delta_state, state_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file_name, state_file_name)
+    except OSError as e:
+        print(f"Could not write delta state {state_file_name}: {e}")
+
+
+class SectionDigest:
+    """
+    Incremental digest of the records of a report section, see add_section_digests. Every record adds
+    its section key and its cells normalised like their column comparator does (see get_column_comparators),
+    leaving out columns not compared, so two sections with the same header and digest compare without deviations
+    (see is_section_data_identical). Cells of text columns are normalised together like remove_space_CRLF does.
+    The digest is None for sections with ragged rows or with rows the key can not be built for, as those have to
+    go through the full comparison. Sections get_section_key has no key for only add their cells.
+    """
+
+    def __init__(self, header):
+        self.key_function = get_section_key(header)
+        self.header_len = len(header)
+        column_comparators = get_column_comparators(header)
+        self.compared_positions = [position for position, column in enumerate(header)
+                                   if column_comparators.get(column) is _text_comparator]
+        self.normalised_positions = [(position, column_comparators[column].normalise)
+                                     for position, column in enumerate(header)
+                                     if column_comparators.get(column) not in (None, _text_comparator)]
+        self.hasher = hashlib.sha1()
+        self.record_count = 0
+
+    def update(self, record):
+        if self.hasher is None:
+            return
+        if len(record.cells) != self.header_len:
+            self.hasher = None
+            return
+        try:
+            key = self.key_function(record) if self.key_function is not None else ''
+        except Exception:
+            self.hasher = None
+            return
+        cells = record.cells
+        self.hasher.update(key.encode('utf-8', 'surrogatepass') + b'\x00')
+        self.hasher.update(_normalise_cells([cells[position] for position in self.compared_positions])
+                           .encode('utf-8', 'surrogatepass') + b'\x00')
+        if self.normalised_positions:
+            # repr tells numbers and dates apart from the text of cells they could not be converted from
+            self.hasher.update(repr([normalise(cells[position]) for position, normalise in self.normalised_positions])
+                               .encode('utf-8', 'surrogatepass') + b'\x00')
+        self.record_count += 1
+
+    def hexdigest(self):
+        if self.hasher is None:
+            return None
+        return f"{self.record_count}:{self.hasher.hexdigest()}"
+
+
+def _normalise_cells(cells):
+    # remove_space_CRLF of every cell, joined by NUL: NUL is neither removed nor stripped, so cells stay apart
+    joined = _crlf_pattern.sub('', '\x00'.join(cells)).replace(" ", "")
+    return _cell_separator_pattern.sub('\x00', joined).strip()
+
+
+def add_section_digests(map_1, map_2):
+    """
+    This method adds the SectionDigest of the sections that may have identical data in both reports: those with
+    the same header and record count in both, which have no digest yet. Digests are computed here rather than
+    while reading the reports, so that sections which can not be identical are not digested.
+    :param map_1: Sections of Expected report, updated in place
+    :param map_2: Sections of Actual report, updated in place
+    """
+    for header_str_key, map_1_section_meta_data in map_1.items():
+        map_2_section_meta_data = map_2.get(header_str_key)
+        if map_2_section_meta_data is None or map_1_section_meta_data.header != map_2_section_meta_data.header \
+                or len(map_1_section_meta_data.rpt_section) != len(map_2_section_meta_data.rpt_section):
+            continue
+        for rpt_section_dict, section_meta_data in [(map_1, map_1_section_meta_data),
+                                                    (map_2, map_2_section_meta_data)]:
+            if section_meta_data.digest is None:
+                section_digest = SectionDigest(section_meta_data.header)
+                for record in section_meta_data.rpt_section:
+                    section_digest.update(record)
+                rpt_section_dict[header_str_key] = section_meta_data._replace(digest=section_digest.hexdigest())
+
+
+def get_report_digest(rpt_section_dict):
+    """
+    This method returns a digest of the whole report from the digests of its sections, or None if any section
+    has no digest. Reports with the same digest compare without deviations.
+    """
+    hasher = hashlib.sha1()
+    for header_str_key, section_meta_data in rpt_section_dict.items():
+        if section_meta_data.digest is None:
+            return None
+        hasher.update(f"{header_str_key}\x00{section_meta_data.digest}\x00".encode('utf-8', 'surrogatepass'))
+    return hasher.hexdigest()
+
+
+def is_report_data_identical(map_1, map_2):
+    """
+    This method returns True, if both reports have the same digest (see get_report_digest), so that none of their
+    sections need their records compared.
+    """
+    report_digest = get_report_digest(map_1)
+    return report_digest is not None and report_digest == get_report_digest(map_2)
+
+
+def is_section_data_identical(map_1_section_meta_data, map_2_section_meta_data):
+    """
+    This method returns True, if a section has the same header, record count and SectionDigest in both reports,
+    so that comparing its records can be skipped.
+    """
+    return map_1_section_meta_data.digest is not None \
+        and map_1_section_meta_data.digest == map_2_section_meta_data.digest \
+        and map_1_section_meta_data.header == map_2_section_meta_data.header
+
+
+def compare_identical_report_data():
+    """
+    This method returns the data comparison result of a section found identical by is_section_data_identical,
+    which is what compare_keyed_report_data reports for it.
+    """
+    data_mismatch_flag, data_error_message = _get_report_data_messages([], [], [])
+    sort_order_flag, sort_order_message = check_sort_order({}, {})
+    return [data_mismatch_flag, sort_order_flag], [data_error_message, sort_order_message]
+
+
 def is_row_skippable(row):
-    Columns_to_be_skipped = ['by Status', 'by Severity']
-    if row[0] in Columns_to_be_skipped:
+    if row[0] in skip_row_values:
         return True
     return False
 
 
+SectionKeySpec = namedtuple('SectionKeySpec', ['name', 'match_columns', 'key_columns', 'normalise'],
+                            defaults=['remove_spaces'])
+# Sections are keyed by the first spec whose match_columns are all in the section header
+section_key_specs = [
+    SectionKeySpec('host_summary', ['IP', 'Network', 'Total Vulnerabilities', 'Security Risk'], ['IP', 'Network']),
+    SectionKeySpec('status_summary', ['Status', 'Confirmed', 'Potential', 'Total'], ['Status']),
+    SectionKeySpec('severity_summary', ['Severity', 'Confirmed', 'Potential', 'Information Gathered', 'Total'],
+                   ['Severity']),
+    SectionKeySpec('host_vulnerabilities', ['IP', 'DNS', 'NetBIOS', 'OS', 'IP Status'],
+                   ['IP', 'DNS', 'NetBIOS', 'QID', 'Type', 'Port', 'Protocol', 'FQDN', 'Instance']),
+    SectionKeySpec('asset_groups', ['Asset Groups', 'IPs', 'Active Hosts'], ['Asset Groups', 'IPs', 'Active Hosts']),
+    SectionKeySpec('total_vulnerabilities', ['Total Vulnerabilities'], ['Total Vulnerabilities']),
+    SectionKeySpec('scan_details', ["Launch Date", "Active Hosts", "Total Hosts", "Type", "Status", "Reference",
+                                    "Scanner Appliance", "Duration", "Scan Title"], ['Launch Date']),
+]
+key_normalisers = {
+    'remove_spaces': lambda value: str(value).replace(" ", ""),
+    'strip': lambda value: str(value).strip(),
+    'casefold': lambda value: str(value).replace(" ", "").casefold(),
+    'none': str,
+}
+
+
+class SectionKeyFunction:
+    """
+    Key extractor of a section, compiled once per section header from a SectionKeySpec.
+    The key is the normalised key column values joined by NUL, which can not occur in a csv value, so keys of
+    different column values never collide. Rows of the section length are read by column position.
+    Key columns that column_specs compare other than as text are normalised by their ColumnComparator first, so
+    that values comparing equal, e.g. 1024 and 1,024 as numbers, give the same key. Tolerances do not apply to
+    keys.
+    """
+
+    def __init__(self, spec, header):
+        positions = SectionColumns(header).positions
+        self.key_columns = list(spec.key_columns)
+        self.header_len = len(header)
+        self.missing_column = next((column for column in self.key_columns if column not in positions), None)
+        normalise = spec.normalise
+        column_comparators = get_column_comparators(header)
+        self.normalisers = [_get_key_column_normaliser(
+            key_normalisers[normalise.get(column, 'remove_spaces') if isinstance(normalise, dict) else normalise],
+            column_comparators.get(column)) for column in self.key_columns]
+        self.remove_spaces_only = all(normaliser is key_normalisers['remove_spaces']
+                                      for normaliser in self.normalisers)
+        if self.missing_column is None:
+            key_positions = [positions[column] for column in self.key_columns]
+            self.get_values = itemgetter(*key_positions) if len(key_positions) > 1 \
+                else lambda cells: (cells[key_positions[0]],)
+
+    def __call__(self, row):
+        if self.missing_column is not None:
+            raise KeyError(self.missing_column)
+        cells = getattr(row, 'cells', None)
+        if cells is not None and len(cells) == self.header_len:
+            values = self.get_values(cells)
+            if self.remove_spaces_only:
+                return '\x00'.join(values).replace(" ", "")
+        else:
+            values = [row[column] for column in self.key_columns]
+        return '\x00'.join(normaliser(value) for normaliser, value in zip(self.normalisers, values))
+
+
+def _get_key_column_normaliser(normaliser, column_comparator):
+    if column_comparator is None or column_comparator is _text_comparator:
+        return normaliser
+    normalise = column_comparator.normalise
+    return lambda value: normaliser(normalise(value))
+
+
+def load_section_key_specs(fileName):
+    """
+    This method reads section key specs from a JSON file holding a list of objects like
+    {"name": "...", "match_columns": [...], "key_columns": [...], "normalise": "remove_spaces"}, where normalise is
+    one of key_normalisers, or an object of key column -> normaliser (remove_spaces for columns not listed).
+    :return: List of SectionKeySpec
+    """
+    with open(fileName, mode='r') as spec_file:
+        specs = [SectionKeySpec(**spec) for spec in json.load(spec_file)]
+    for spec in specs:
+        normalisers = spec.normalise.values() if isinstance(spec.normalise, dict) else [spec.normalise]
+        for normaliser in normalisers:
+            if normaliser not in key_normalisers:
+                raise ValueError(f"Section key spec [{spec.name}]: normalise must be one of {list(key_normalisers)}, "
+                                 f"not [{normaliser}]")
+    return specs
+
+
+def _set_section_key_specs(specs):
+    global section_key_specs
+    section_key_specs = specs
+
+
+def _init_worker_process(specs, column_comparison_specs):
+    _set_section_key_specs(specs)
+    _set_column_specs(column_comparison_specs)
+    # Stages run in a worker are profiled by _call_with_stage_profile, not by a profiler forked from this process
+    _set_stage_profiler(None)
+
+
+def _create_process_pool(workers):
+    # Imported on first use, as most comparisons run in one process
+    from concurrent.futures import ProcessPoolExecutor
+    # Workers get the section key and column specs of this process, also when they are not forked from it
+    return ProcessPoolExecutor(workers, initializer=_init_worker_process,
+                               initargs=(section_key_specs, column_specs))
+
+
+def _submit_section_comparison(executor, *args):
+    if stage_profiler is None:
+        return executor.submit(compare_report_section, *args)
+    return executor.submit(_call_with_stage_profile, compare_report_section, *args)
+
+
 def get_section_key(section_header):
-    col_list_1 = ['IP', 'Network', 'Total Vulnerabilities', 'Security Risk']
-    col_list_2 = ['Status', 'Confirmed', 'Potential', 'Total']
-    col_list_3 = ['Severity', 'Confirmed', 'Potential', 'Information Gathered', 'Total']
-    col_list_4 = ['IP', 'DNS', 'NetBIOS', 'OS', 'IP Status']
-    col_list_5 = ['Asset Groups', 'IPs', 'Active Hosts']
-    col_list_6 = ['Total Vulnerabilities']
-    col_list_7 = ["Launch Date", "Active Hosts", "Total Hosts", "Type", "Status", "Reference", "Scanner Appliance", "Duration", "Scan Title"]
-
-
-    # check if row contains all elements of col_list_2 using all()
-    res_1 = all(elem in section_header for elem in col_list_1)
-    res_2 = all(elem in section_header for elem in col_list_2)
-    res_3 = all(elem in section_header for elem in col_list_3)
-    res_4 = all(elem in section_header for elem in col_list_4)
-    res_5 = all(elem in section_header for elem in col_list_5)
-    res_6 = all(elem in section_header for elem in col_list_6)
-    res_7 = all(elem in section_header for elem in col_list_7)
-
-    if res_1 & res_2 & res_3 & res_4 & res_5 & res_6 & res_7:
-        raise Exception("bitwise operation (res_1 & res_2 & res_3 & res_4 & res_5 & res_6 & res_7) must not be true")
-
-    if res_1:
-        return lambda row: str(row["IP"] + "|" + row["Network"]).replace(" ", "")
-    elif res_2:
-        return lambda row: str(row["Status"]).replace(" ", "")
-    elif res_3:
-        return lambda row: str(row["Severity"]).replace(" ", "")
-    elif res_4:
-        return lambda row: str(row["IP"] +  "|" + row["DNS"] + "|" + row["NetBIOS"] + "|" + row[
-            "QID"] + "|" + row["Type"] + "|" + row["Port"] + "|" + row["Protocol"] + "|" + row["FQDN"] + "|" + str(row[
-                                   "Instance"])).replace(" ", "")
-    elif res_5:
-        return lambda row: str(row["Asset Groups"] + "|" + row["IPs"] + "|" + row["Active Hosts"]).replace(" ", "")
-    elif res_6:
-        return lambda row: str(row["Total Vulnerabilities"]).replace(" ", "")
-    elif res_7:
-        return lambda row: str(row["Launch Date"]).replace(" ", "")
+    header_columns = set(section_header)
+    matching_specs = [spec for spec in section_key_specs if header_columns.issuperset(spec.match_columns)]
+
+    if len(matching_specs) == len(section_key_specs) > 1:
+        raise Exception("Section header must not match all section key specs")
+
+    if matching_specs:
+        return SectionKeyFunction(matching_specs[0], section_header)
     else:
         return None
 
@@ -128,8 +856,7 @@ def conv_section_rows_to_dict(section_row_list, section_key_lambda):
 
 
 def is_row_col_val_conv_req(line_no, row):
-    excl_header_str_list = ['No vulnerabilities match your filters for these hosts',
-                            'No results available for these hosts']
+    excl_header_str_list = no_data_banners
     if line_no <= 3:
         return False
     else:
@@ -141,8 +868,9 @@ def is_row_col_val_conv_req(line_no, row):
 
 def create_section_metadata(line_no, header):
     rpt_section = []
+    row_line_no = []
     section_start = line_no
-    section_meta_data = SectionMetaData(section_start, header, rpt_section)
+    section_meta_data = SectionMetaData(section_start, header, rpt_section, row_line_no)
     return section_meta_data
 
 
@@ -166,15 +894,76 @@ def compare_no_of_rpt_sections(expected_dict, actual_dict):
 
 
 def convert_row_to_col_val(fieldnames, row):
-    d = OrderedDict(zip(fieldnames, row))
-    lf = len(fieldnames)
-    lr = len(row)
-    if lf < lr:
-        d[None] = row[lf:]
-    elif lf > lr:
-        for key in fieldnames[lr:]:
-            d[key] = None
-    return d
+    """
+    This method maps a data row to the column header of its section.
+    :param fieldnames: Column header, or SectionColumns shared by all rows of the section
+    :param row: Data row
+    :return: ReportRecord of the row
+    """
+    if not isinstance(fieldnames, SectionColumns):
+        fieldnames = SectionColumns(fieldnames)
+    return ReportRecord(fieldnames, row)
+
+
+class SectionColumns:
+    """
+    Column header of a report section, built once per section and shared by all its ReportRecord objects.
+    A repeated column name maps to the position of its last occurrence, like OrderedDict(zip(header, row)) does.
+    """
+    __slots__ = ('header', 'positions')
+
+    def __init__(self, header):
+        self.header = header
+        self.positions = {}
+        for position, column in enumerate(header):
+            self.positions[column] = position
+
+
+class ReportRecord(Mapping):
+    """
+    Read-only column -> value mapping of one data row, holding the csv row as is instead of one dict per row.
+    It behaves like the OrderedDict records were built as before: extra cells are listed under the None key and
+    columns missing from a short row have None values.
+    """
+    __slots__ = ('columns', 'cells')
+
+    def __init__(self, columns, cells):
+        self.columns = columns
+        self.cells = cells
+
+    def __getitem__(self, key):
+        header_len = len(self.columns.header)
+        if key is None and len(self.cells) > header_len:
+            return self.cells[header_len:]
+        position = self.columns.positions[key]
+        return self.cells[position] if position < len(self.cells) else None
+
+    def get(self, key, default=None):
+        if key in self.columns.positions or key is None and len(self.cells) > len(self.columns.header):
+            return self[key]
+        return default
+
+    def __contains__(self, key):
+        return key in self.columns.positions or key is None and len(self.cells) > len(self.columns.header)
+
+    def __iter__(self):
+        yield from self.columns.positions
+        if len(self.cells) > len(self.columns.header):
+            yield None
+
+    def __len__(self):
+        return len(self.columns.positions) + (len(self.cells) > len(self.columns.header))
+
+    def items(self):
+        cells = self.cells
+        cell_count = len(cells)
+        for column, position in self.columns.positions.items():
+            yield column, cells[position] if position < cell_count else None
+        if cell_count > len(self.columns.header):
+            yield None, cells[len(self.columns.header):]
+
+    def __repr__(self):
+        return repr(OrderedDict(self.items()))
 
 
 def compare_report_header(map_1_headers, map_2_headers):
@@ -183,25 +972,44 @@ def compare_report_header(map_1_headers, map_2_headers):
     columns_not_matching_per_key.append(f"Comparing column headers:")
     if len(map_1_headers) != len(map_2_headers):
         msg = f"Column_Header_Deviation | Expected Column count: [{len(map_1_headers)}] | Actual Column count: [{len(map_2_headers)}]"
-        columns_not_matching_per_key.append(msg)
+        columns_not_matching_per_key.append(Deviation('Column_Header_Deviation', expected=len(map_1_headers),
+                                                      actual=len(map_2_headers), message=msg))
         go_ahead_flag = False
+    exp_columns = set(map_1_headers)
+    act_columns = set(map_2_headers)
     for expected_column in map_1_headers:
-        if expected_column not in map_2_headers:
+        if expected_column not in act_columns:
             msg = f"Column_Header_Deviation | Expected Column: [{expected_column}] not found Actual Column list: [{map_2_headers}]"
-            columns_not_matching_per_key.append(msg)
+            columns_not_matching_per_key.append(Deviation('Column_Header_Deviation', column=expected_column,
+                                                          expected=expected_column, message=msg))
             go_ahead_flag = False
     for actual_column in map_2_headers:
-        if actual_column not in map_1_headers:
+        if actual_column not in exp_columns:
             msg = f"Column_Header_Deviation | Actual Column: [{actual_column}] not found Expected Column list: [{map_1_headers}]"
-            columns_not_matching_per_key.append(msg)
+            columns_not_matching_per_key.append(Deviation('Column_Header_Deviation', column=actual_column,
+                                                          actual=actual_column, message=msg))
             go_ahead_flag = False
 
     if map_1_headers == map_2_headers:
         go_ahead_flag = True
         columns_not_matching_per_key.append(f"No deviation found in column headers")
+    elif go_ahead_flag:
+        columns_not_matching_per_key.append(f"Column order differs in Actual report, columns are compared by name")
     return go_ahead_flag, columns_not_matching_per_key
 
 
+def get_column_permutation(exp_columns, act_columns):
+    """
+    This method aligns the columns of a section in both reports by name.
+    :param exp_columns: SectionColumns of Expected report
+    :param act_columns: SectionColumns of Actual report
+    :return: List of (column, Expected position, Actual position or None if the column is absent in Actual report)
+             in Expected column order
+    """
+    return [(column, exp_position, act_columns.positions.get(column))
+            for column, exp_position in exp_columns.positions.items()]
+
+
 def _get_req_data_from_record(data_row):
     display_columns_for_missing_data = ['IP', 'Network', 'DNS', 'NetBIOS', 'OS', 'QID']
     msg = ' '
@@ -213,23 +1021,21 @@ def _get_req_data_from_record(data_row):
 
 
 def _get_list_data_as_string(data_list, enable_numbering=True):
-    result = ''
+    return ''.join(_iter_list_data_strings(data_list, enable_numbering))
+
+
+def _iter_list_data_strings(data_list, enable_numbering=True):
     item_no = 1
-    if enable_numbering:
-        for data in data_list:
-            if len(data) != 0:
-                result += '\n[' + str(item_no) + '] ' + str(data) + '\n'
-                item_no += 1
-    else:
-        for data in data_list:
-            if len(data) != 0:
-                if isinstance(data, list):
-                    for item in data:
-                        result += '\n' + str(item) + '\n'
-                else:
-                    result += '\n' + str(data) + '\n'
-                item_no += 1
-    return result
+    for data in data_list:
+        if len(data) != 0:
+            if enable_numbering:
+                yield '\n[' + str(item_no) + '] ' + str(data) + '\n'
+            elif isinstance(data, list):
+                for item in data:
+                    yield '\n' + str(item) + '\n'
+            else:
+                yield '\n' + str(data) + '\n'
+            item_no += 1
 
 
 def compare_odict_keys(exp, act):
@@ -249,7 +1055,37 @@ def compare_odict_keys(exp, act):
     return diff
 
 
-def compare_report_sections(map_1, map_2):
+def match_report_sections(map_1, map_2):
+    """
+    This method matches sections of Actual report absent in Expected report by their header string to sections of
+    Expected report with the same columns in another order, so that those are compared as well.
+    :param map_1: Sections of Expected report
+    :param map_2: Sections of Actual report
+    :return: Sections of Actual report, where matched sections are keyed by the header string of the Expected
+             report section instead of their own
+    """
+    unmatched_sections = {}
+    for header_str_key, section_meta_data in map_1.items():
+        if header_str_key not in map_2:
+            unmatched_sections.setdefault(_get_header_columns(section_meta_data.header), []).append(header_str_key)
+    if not unmatched_sections:
+        return map_2
+    matched_sections = OrderedDict()
+    for header_str_key, section_meta_data in map_2.items():
+        if header_str_key not in map_1:
+            exp_header_str_keys = unmatched_sections.get(_get_header_columns(section_meta_data.header))
+            if exp_header_str_keys:
+                header_str_key = exp_header_str_keys.pop(0)
+        matched_sections[header_str_key] = section_meta_data
+    return matched_sections
+
+
+def _get_header_columns(header):
+    # Columns of a header regardless of their order, as stripped for the header string
+    return tuple(sorted(str(column).strip() for column in header))
+
+
+def compare_report_sections(map_1, map_2, identical_data=False):
     section_error_messages = []
     go_ahead_flag = True
     msg = "Section comparison summary:"
@@ -258,168 +1094,1441 @@ def compare_report_sections(map_1, map_2):
     section_error_messages.append(msg)
     msg = f"Number of sections in Actual report: {len(map_2)}"
     section_error_messages.append(msg)
+    identical_sections = sum(1 for header_str, section_meta_data in map_1.items() if header_str in map_2 and
+                             is_section_data_identical(section_meta_data, map_2[header_str]))
+    msg = f"Number of sections with identical data in both reports (record comparison skipped): {identical_sections}"
+    section_error_messages.append(msg)
+    if identical_data:
+        section_error_messages.append("Expected and Actual reports have identical data")
 
     present_in_expected_missing_in_actual = compare_odict_keys(map_1, map_2)
     present_in_actual_missing_in_expected = compare_odict_keys(map_2, map_1)
     print(_get_list_data_as_string(present_in_expected_missing_in_actual))
     if not len(present_in_expected_missing_in_actual) == 0:
         msg = f"Report_Section_Deviation | Following sections are present in Expected report and absent in Actual report: {_get_list_data_as_string(present_in_expected_missing_in_actual)}"
-        section_error_messages.append(msg)
+        section_error_messages.append(Deviation('Report_Section_Deviation',
+                                                expected=tuple(present_in_expected_missing_in_actual), message=msg))
         go_ahead_flag = False
     if not len(present_in_actual_missing_in_expected) == 0:
         msg = f"Report_Section_Deviation | Following sections are present in Actual report and absent in Expected report: {_get_list_data_as_string(present_in_actual_missing_in_expected)}"
-        section_error_messages.append(msg)
+        section_error_messages.append(Deviation('Report_Section_Deviation',
+                                                actual=tuple(present_in_actual_missing_in_expected), message=msg))
         go_ahead_flag = False
     return go_ahead_flag, section_error_messages
 
 
 def remove_space_CRLF(string):
-    return re.sub('\r?\n', '', string).strip().replace(" ", "")
+    return _crlf_pattern.sub('', string).strip().replace(" ", "")
+
+
+ColumnSpec = namedtuple('ColumnSpec', ['name', 'match_columns', 'columns'])
+# Columns of sections whose header has all match_columns of a spec are compared as the spec configures them, as a
+# column -> options mapping where options['type'] is one of column_types; earlier specs take precedence
+column_specs = [
+    ColumnSpec('counts', [], {column: {'type': 'numeric'} for column in
+                              ['Total Vulnerabilities', 'Average Security Risk', 'Security Risk', 'Active Hosts',
+                               'Total Hosts', 'Confirmed', 'Potential', 'Information Gathered', 'Total']}),
+]
+column_types = ['text', 'skip', 'numeric', 'date', 'casefold', 'regex']
+_column_comparator_cache = {}
+
+
+class ColumnComparator:
+    """
+    Compares the cells of one column after normalising them with normalise, which falls back to the
+    remove_space_CRLF value for cells it can not convert. Numbers may differ by abs_tolerance, or by rel_tolerance
+    of the larger one.
+    """
+
+    def __init__(self, normalise=remove_space_CRLF, abs_tolerance=0.0, rel_tolerance=0.0):
+        self.normalise = normalise
+        self.abs_tolerance = abs_tolerance
+        self.rel_tolerance = rel_tolerance
+        self.tolerant = abs_tolerance > 0 or rel_tolerance > 0
+
+    def equal(self, exp_value, act_value):
+        if exp_value == act_value:
+            return True
+        exp_value = self.normalise(exp_value)
+        act_value = self.normalise(act_value)
+        return exp_value == act_value or (self.tolerant and self._within_tolerance(exp_value, act_value))
+
+    def find_mismatches(self, exp_values, act_values):
+        """
+        This method compares a whole column of records. Cells that are the same as is need no normalising, the
+        others are normalised a column at a time.
+        :return: List of the record nos whose cells differ
+        """
+        record_nos = [record_no for record_no, (exp_value, act_value) in enumerate(zip(exp_values, act_values))
+                      if exp_value != act_value]
+        if not record_nos:
+            return record_nos
+        normalised_exp_values = list(map(self.normalise, [exp_values[record_no] for record_no in record_nos]))
+        normalised_act_values = list(map(self.normalise, [act_values[record_no] for record_no in record_nos]))
+        return [record_no for record_no, exp_value, act_value in zip(record_nos, normalised_exp_values,
+                                                                     normalised_act_values)
+                if exp_value != act_value and not (self.tolerant and self._within_tolerance(exp_value, act_value))]
+
+    def _within_tolerance(self, exp_value, act_value):
+        return isinstance(exp_value, float) and isinstance(act_value, float) and \
+            math.isclose(exp_value, act_value, rel_tol=self.rel_tolerance, abs_tol=self.abs_tolerance)
+
+
+_text_comparator = ColumnComparator()
+
+
+def _parse_number(value):
+    text = remove_space_CRLF(value)
+    try:
+        # Thousands separators are not significant: 1,024 is 1024
+        return float(text.replace(',', ''))
+    except ValueError:
+        return text
 
 
-def compare_report_data_dicts(exp, act, explinenumber, actlinenumber):
+def _get_date_parser(formats):
+    def parse_date(value):
+        text = _crlf_pattern.sub('', value).strip()
+        for date_format in formats:
+            try:
+                return datetime.strptime(text, date_format)
+            except ValueError:
+                pass
+        return remove_space_CRLF(value)
+    return parse_date
+
+
+def compile_column_comparator(options):
+    """
+    This method compiles the options of a column in a ColumnSpec.
+    :param options: {"type": "text"}, {"type": "skip"}, {"type": "casefold"},
+                    {"type": "numeric", "abs_tolerance": 0.5, "rel_tolerance": 0.01} (tolerances default to 0),
+                    {"type": "date", "format": "%m/%d/%Y %H:%M:%S"} (format may be a list of formats) or
+                    {"type": "regex", "pattern": "..."} (text matching pattern is left out of the comparison)
+    :return: ColumnComparator, or None for columns not to be compared
+    """
+    column_type = options.get('type', 'text')
+    if column_type == 'skip':
+        return None
+    if column_type == 'text':
+        return _text_comparator
+    if column_type == 'casefold':
+        return ColumnComparator(lambda value: remove_space_CRLF(value).casefold())
+    if column_type == 'numeric':
+        return ColumnComparator(_parse_number, float(options.get('abs_tolerance', 0.0)),
+                                float(options.get('rel_tolerance', 0.0)))
+    if column_type == 'date':
+        formats = options['format']
+        return ColumnComparator(_get_date_parser([formats] if isinstance(formats, str) else list(formats)))
+    if column_type == 'regex':
+        pattern = re.compile(options['pattern'])
+        return ColumnComparator(lambda value: remove_space_CRLF(pattern.sub('', value)))
+    raise ValueError(f"Column type must be one of {column_types}, not [{column_type}]")
+
+
+def get_column_comparators(header):
+    """
+    This method returns the column function table of a section header, compiled once per header from
+    column_specs: columns in skip_columns or of type skip map to None, columns no spec configures to the text
+    comparison of remove_space_CRLF.
+    :return: dict of column -> ColumnComparator or None
+    """
+    header = tuple(header)
+    column_comparators = _column_comparator_cache.get(header)
+    if column_comparators is None:
+        header_columns = set(header)
+        column_comparators = {column: None if column in skip_columns else _text_comparator for column in header}
+        for spec in reversed([spec for spec in column_specs if header_columns.issuperset(spec.match_columns)]):
+            for column, options in spec.columns.items():
+                if column in column_comparators and column not in skip_columns:
+                    column_comparators[column] = compile_column_comparator(options)
+        _column_comparator_cache[header] = column_comparators
+    return column_comparators
+
+
+def load_column_specs(fileName):
+    """
+    This method reads column specs from a JSON file holding a list of objects like
+    {"name": "...", "match_columns": [...], "columns": {"column": {"type": "numeric", "abs_tolerance": 1}}}, see
+    compile_column_comparator for the column options.
+    :return: List of ColumnSpec
+    """
+    with open(fileName, mode='r') as spec_file:
+        specs = [ColumnSpec(**spec) for spec in json.load(spec_file)]
+    for spec in specs:
+        for column, options in spec.columns.items():
+            try:
+                compile_column_comparator(options)
+            except (KeyError, ValueError, re.error) as e:
+                raise ValueError(f"Column spec [{spec.name}], column [{column}]: {e!r}")
+    return specs
+
+
+def _set_column_specs(specs):
+    global column_specs
+    column_specs = specs
+    _column_comparator_cache.clear()
+
+
+def compare_report_data_dicts(exp, act, explinenumber, actlinenumber, record_key=None):
     data_error_message = []
-    skip_columns = ['Date Range']
     data_mismatch_flag = True
+    columns = getattr(exp, 'columns', None)
+    column_comparators = get_column_comparators(exp.keys() if columns is None else columns.header)
     for key, value in exp.items():
-        if key not in skip_columns:
+        column_comparator = column_comparators.get(key, _text_comparator)
+        if column_comparator is not None:
             if key in act.keys():
-                if remove_space_CRLF(value) != remove_space_CRLF(act.get(key)):
-                    deviation_header = "Column_Data_Deviation_" + key.replace(" ", "_")
-                    msg = f"{deviation_header} | Line in Expected report: {explinenumber} ; Line in Actual report: {actlinenumber} | Column: {key} | Expected: [{value}] Actual: [{act.get(key)}]"
+                if not column_comparator.equal(value, act.get(key)):
+                    msg = _get_data_deviation_message(key, value, act.get(key), explinenumber, actlinenumber,
+                                                      record_key)
                     data_error_message.append(msg)
                     data_mismatch_flag = False
             else:
-                deviation_header = "Column_Data_Deviation_" + key.replace(" ", "_")
-                msg = f"{deviation_header} | Line in Expected report: {explinenumber} ; Line in Actual report: {actlinenumber} | Column: {key} is presemt in Expected report, absent in Actual report"
+                msg = _get_absent_column_message(key, explinenumber, actlinenumber, record_key)
                 data_error_message.append(msg)
                 data_mismatch_flag = False
     return data_mismatch_flag, data_error_message
 
 
-def get_data_for_sort_order_validation(lst_odict, header):
-    result_lst = []
-    result_odict = OrderedDict()
+def _get_data_deviation_message(key, value, act_value, explinenumber, actlinenumber, record_key=None):
+    deviation_header = "Column_Data_Deviation_" + key.replace(" ", "_")
+    msg = f"{deviation_header} | Line in Expected report: {explinenumber} ; Line in Actual report: {actlinenumber} | Column: {key} | Expected: [{value}] Actual: [{act_value}]"
+    return Deviation('Column_Data_Deviation', None, key, record_key, value, act_value, explinenumber, actlinenumber,
+                     msg)
+
+
+def _get_absent_column_message(key, explinenumber, actlinenumber, record_key=None):
+    deviation_header = "Column_Data_Deviation_" + key.replace(" ", "_")
+    msg = f"{deviation_header} | Line in Expected report: {explinenumber} ; Line in Actual report: {actlinenumber} | Column: {key} is presemt in Expected report, absent in Actual report"
+    return Deviation('Column_Data_Deviation', None, key, record_key, None, None, explinenumber, actlinenumber, msg)
+
+
+def _get_moved_deviation(deviation, explinenumber, actlinenumber):
+    if deviation.exp_line_no == explinenumber and deviation.act_line_no == actlinenumber:
+        return deviation
+    if deviation.expected is None and deviation.actual is None:
+        moved_deviation = _get_absent_column_message(deviation.column, explinenumber, actlinenumber, deviation.key)
+    else:
+        moved_deviation = _get_data_deviation_message(deviation.column, deviation.expected, deviation.actual,
+                                                      explinenumber, actlinenumber, deviation.key)
+    return moved_deviation._replace(section=deviation.section)
+
+
+def _get_absent_record_deviation(record_key, record, line_no, absent_in):
+    if absent_in == 'Actual':
+        return Deviation('Record_Absent_Deviation', key=record_key, expected=record, exp_line_no=line_no,
+                         message=f"Record_Absent_Deviation | Line in Expected report: {line_no} | Record absent in Actual report")
+    return Deviation('Record_Absent_Deviation', key=record_key, actual=record, act_line_no=line_no,
+                     message=f"Record_Absent_Deviation | Line in Actual report: {line_no} | Record absent in Expected report")
+
+
+def _load_numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _get_uniform_columns(records):
+    """
+    This method returns the SectionColumns shared by all records, or None if records are not ReportRecord objects
+    of one section or some of them are ragged rows.
+    """
+    columns = getattr(records[0], 'columns', None)
+    if columns is None:
+        return None
+    header_len = len(columns.header)
+    for record in records:
+        if getattr(record, 'columns', None) is not columns or len(record.cells) != header_len:
+            return None
+    return columns
+
+
+def _normalise_column(numpy, values):
+    # Same normalisation as remove_space_CRLF, applied to a whole column at once
+    column = numpy.array(values, dtype=str)
+    column = numpy.char.replace(numpy.char.replace(column, '\r\n', ''), '\n', '')
+    return numpy.char.replace(numpy.char.strip(column), ' ', '')
+
+
+def compare_report_records_vectorized(compared, index_exp, index_act):
+    """
+    This method compares records present in both reports column by column with NumPy, see
+    compare_report_records_by_column.
+    :return: List of (position, data_mismatch_flag, data_error_message), or None if NumPy is not installed or
+             records are not uniform rows of one section, in which case compare_report_data_dicts is to be used
+    """
+    numpy = _load_numpy()
+    if numpy is None:
+        return None
+    return compare_report_records_by_column(compared, index_exp, index_act, numpy)
+
+
+def compare_report_records_by_column(compared, index_exp, index_act, numpy=None):
+    """
+    This method compares records present in both reports column by column: each column is normalised at once by
+    its ColumnComparator from get_column_comparators and compared, and messages are only built for mismatching
+    cells, in the same order compare_report_data_dicts produces them.
+    :param compared: List of (key, Expected record, Actual record), in Expected report order
+    :param numpy: NumPy module, if given columns compared as text are normalised and compared as arrays
+    :return: List of (position, data_mismatch_flag, data_error_message), or None if records are not uniform rows
+             of one section, in which case compare_report_data_dicts is to be used
+    """
+    if len(compared) == 0:
+        return None
+    exp_columns = _get_uniform_columns([exp_row_val for exp_row_key, exp_row_val, act_row_val in compared])
+    act_columns = _get_uniform_columns([act_row_val for exp_row_key, exp_row_val, act_row_val in compared])
+    if exp_columns is None or act_columns is None:
+        return None
+
+    column_comparators = get_column_comparators(exp_columns.header)
+    exp_line_numbers = [index_exp[exp_row_key].line_no for exp_row_key, exp_row_val, act_row_val in compared]
+    act_line_numbers = [index_act[exp_row_key].line_no for exp_row_key, exp_row_val, act_row_val in compared]
+    data_error_messages = [[] for _ in compared]
+    for key, exp_position, act_position in get_column_permutation(exp_columns, act_columns):
+        column_comparator = column_comparators[key]
+        if column_comparator is None:
+            continue
+        if act_position is None:
+            for record_no, data_error_message in enumerate(data_error_messages):
+                data_error_message.append(_get_absent_column_message(key, exp_line_numbers[record_no],
+                                                                     act_line_numbers[record_no],
+                                                                     compared[record_no][0]))
+            continue
+        exp_values = [exp_row_val.cells[exp_position] for exp_row_key, exp_row_val, act_row_val in compared]
+        act_values = [act_row_val.cells[act_position] for exp_row_key, exp_row_val, act_row_val in compared]
+        if numpy is not None and column_comparator is _text_comparator:
+            mismatches = numpy.flatnonzero(_normalise_column(numpy, exp_values) !=
+                                           _normalise_column(numpy, act_values))
+        else:
+            mismatches = column_comparator.find_mismatches(exp_values, act_values)
+        for record_no in mismatches:
+            data_error_messages[record_no].append(
+                _get_data_deviation_message(key, exp_values[record_no], act_values[record_no],
+                                            exp_line_numbers[record_no], act_line_numbers[record_no],
+                                            compared[record_no][0]))
+    return [(index_exp[exp_row_key].position, len(data_error_message) == 0, data_error_message)
+            for (exp_row_key, exp_row_val, act_row_val), data_error_message in zip(compared, data_error_messages)]
+
+
+def get_data_for_sort_order_validation(lst_odict, header, line_numbers=None, section_start=0):
+    """
+    This method keys the records of a report section.
+    :param lst_odict: Records of the section
+    :param header: Column header of the section
+    :param line_numbers: Source line number of each record, as read by read_report_sections_in_dict
+    :param section_start: Line number of the section header, used when line_numbers is not available
+    :return: List of keys, OrderedDict of key -> record and dict of key -> RowPosition(position, line_no)
+    """
+    if line_numbers is None:
+        line_numbers = itertools.count(section_start)
+    return key_section_records(zip(line_numbers, lst_odict), header)
+
+
+def key_section_records(numbered_rows, header, record_store=None):
+    """
+    This method keys (line_no, record) pairs of a report section.
+    :param numbered_rows: Iterable of (line_no, record) pairs
+    :param header: Column header of the section
+    :param record_store: Optional SpillableRecordStore to key the records into, instead of an in-memory OrderedDict
+    :return: List of keys (None when record_store is given), key -> record mapping and key -> RowPosition mapping
+    """
+    result_lst = [] if record_store is None else None
+    result_odict = OrderedDict() if record_store is None else record_store
+    result_index = {}
+    key_counts = {}
+    row = None
     try:
         header_row_key = get_section_key(header)
-        for row in lst_odict:
+        for line_no, row in numbered_rows:
             row_key = header_row_key(row)
-            result_lst.append(row_key)
-            result_odict[row_key] = row
+            if record_store is None:
+                if row_key in result_index:
+                    # Records sharing a key are all kept, see get_duplicate_key_index
+                    key_count = key_counts.get(row_key, 1) + 1
+                    key_counts[row_key] = key_count
+                    row_key = _get_occurrence_key(row_key, key_count)
+                result_lst.append(row_key)
+                result_odict[row_key] = row
+                result_index[row_key] = RowPosition(len(result_index), line_no)
+            else:
+                record_store.add(row_key, row, line_no)
     except Exception as e:
         print("Exception occured while validating the reports")
         print(e)
         print(row)
         print(traceback.format_exc())
-    return result_lst, result_odict
+    if record_store is not None:
+        result_index = record_store.index
+    return result_lst, result_odict, result_index
+
+
+def _get_occurrence_key(record_key, key_count):
+    return f"{record_key}{_duplicate_key_separator}{key_count}"
+
+
+def get_record_key(key):
+    """
+    This method returns the record key of a key made by key_section_records, also for later records sharing a key.
+    """
+    return key.partition(_duplicate_key_separator)[0]
+
+
+def get_duplicate_key_index(odict):
+    """
+    This method builds the multiset index of the keyed records of a section that share a key.
+    :param odict: Key -> record mapping made by key_section_records
+    :return: OrderedDict of record key -> keys of its records in report order, their RowPosition in the key ->
+             RowPosition mapping, for record keys of more than one record
+    """
+    duplicate_key_index = OrderedDict()
+    for key in odict:
+        if _duplicate_key_separator in key:
+            record_key = get_record_key(key)
+            occurrence_keys = duplicate_key_index.get(record_key)
+            if occurrence_keys is None:
+                duplicate_key_index[record_key] = [record_key, key]
+            else:
+                occurrence_keys.append(key)
+    return duplicate_key_index
 
 
 def find_missing_records(exp, act):
     missing_records = []
     for key, val in exp.items():
-        if key not in act.keys():
+        if key not in act:
             missing_records.append(val)
     return missing_records
 
 
-def compare_report_data(odict_exp, odict_act, exp_section_start, act_section_start):
+def compare_report_data(odict_exp, odict_act, index_exp, index_act, executor=None, partitions=1, options=None,
+                        reused_records=None, duplicate_keys=None):
+    """
+    This method compares the keyed records of a report section.
+    :param executor: Optional ProcessPoolExecutor; when given with partitions > 1, records are split into key-hash
+                     partitions compared in parallel and merged back in section order
+    :param options: ComparisonOptions
+    :param reused_records: Optional dict of key -> Column_Data_Deviation list of records known to compare like in
+                           a previous run (see get_reused_records), which are not compared again
+    :param duplicate_keys: Record keys shared by several records in either report (see get_duplicate_key_index),
+                           found from the keys when not given
+    :return: Data comparison flags and messages of the section
+    """
+    if executor is None or partitions <= 1:
+        return _get_report_data_messages(*compare_report_data_partition(odict_exp, odict_act, index_exp, index_act,
+                                                                        options, reused_records, duplicate_keys))
+
+    exp_partitions = partition_keyed_records(odict_exp, index_exp, partitions)
+    act_partitions = partition_keyed_records(odict_act, index_act, partitions)
+    futures = [executor.submit(compare_report_data_partition, exp_odict, act_odict, exp_index, act_index, options,
+                               None if reused_records is None else
+                               {key: reused_records[key] for key in exp_odict if key in reused_records},
+                               None if duplicate_keys is None else
+                               {record_key for record_key in duplicate_keys
+                                if hash(record_key) % partitions == partition_no})
+               for partition_no, ((exp_odict, exp_index), (act_odict, act_index))
+               in enumerate(zip(exp_partitions, act_partitions))]
+    results = [future.result() for future in futures]
+    position = itemgetter(0)
+    return _get_report_data_messages(list(merge(*[result[0] for result in results], key=position)),
+                                     list(merge(*[result[1] for result in results], key=position)),
+                                     list(merge(*[result[2] for result in results], key=position)),
+                                     sum(result[3] for result in results))
+
+
+def partition_keyed_records(odict, index, partitions):
+    """
+    This method splits keyed records of a section by record key hash, keeping section order within each partition,
+    so that records sharing a key are in the same partition.
+    :return: List of (OrderedDict of key -> record, dict of key -> RowPosition) per partition
+    """
+    result = [(OrderedDict(), {}) for _ in range(partitions)]
+    for key, record in odict.items():
+        partition_odict, partition_index = result[hash(get_record_key(key)) % partitions]
+        partition_odict[key] = record
+        partition_index[key] = index[key]
+    return result
+
+
+def compare_report_data_partition(odict_exp, odict_act, index_exp, index_act, options=None, reused_records=None,
+                                  duplicate_keys=None):
+    """
+    This method compares keyed records of a section, or of one key-hash partition of it.
+    Results carry the record position in the section, so that partitions can be merged back in section order.
+    Records in reused_records are not compared, their deviations are moved to their current line numbers.
+    Records sharing a key are paired by pair_duplicate_records.
+    Only the records with deviations are kept, the others are counted, so that memory does not grow with the
+    number of records of a spilled section.
+    :return: Lists of (position, record) missing in Actual, (position, record) missing in Expected and
+             (position, data_mismatch_flag, data_error_message) for records present in both reports that have
+             deviations, where records missing in one of the reports are given as Deviation, and the number of
+             records present in both reports without deviations
+    """
+    if duplicate_keys is None:
+        duplicate_keys = get_duplicate_key_index(odict_exp).keys() | get_duplicate_key_index(odict_act).keys()
+    duplicate_records = None
+    if duplicate_keys:
+        duplicate_records = compare_duplicate_records(duplicate_keys, odict_exp, odict_act, index_exp, index_act)
+        if reused_records:
+            # Records sharing a key may be paired differently than in the previous run
+            reused_records = {key: deviations for key, deviations in reused_records.items()
+                              if get_record_key(key) not in duplicate_keys}
+    present_in_exp_absent_in_act = [(index_exp[key].position,
+                                     _get_absent_record_deviation(key, val, index_exp[key].line_no, 'Actual'))
+                                    for key, val in _iter_unique_key_records(odict_exp, duplicate_keys)
+                                    if key not in odict_act]
+    present_in_act_absent_in_exp = [(index_act[key].position,
+                                     _get_absent_record_deviation(key, val, index_act[key].line_no, 'Expected'))
+                                    for key, val in _iter_unique_key_records(odict_act, duplicate_keys)
+                                    if key not in odict_exp]
+    reused_compared_records = []
+    if reused_records:
+        for exp_row_key, deviations in reused_records.items():
+            if exp_row_key in odict_exp and exp_row_key in odict_act:
+                data_error_message = [_get_moved_deviation(deviation, index_exp[exp_row_key].line_no,
+                                                           index_act[exp_row_key].line_no)
+                                      for deviation in deviations]
+                reused_compared_records.append((index_exp[exp_row_key].position, len(data_error_message) == 0,
+                                                data_error_message))
+        reused_compared_records.sort(key=itemgetter(0))
+        odict_exp = OrderedDict((key, val) for key, val in odict_exp.items() if key not in reused_records)
+    numpy = _load_numpy() if options is not None and options.compare_backend == 'numpy' else None
+    compared_records, matching_records = _split_compared_records(reused_compared_records)
+    deviating_records = []
+    compared_items = ((exp_row_key, exp_row_val, odict_act.get(exp_row_key)) for exp_row_key, exp_row_val
+                      in _iter_unique_key_records(odict_exp, duplicate_keys) if exp_row_key in odict_act)
+    chunk_size = _get_compare_chunk_size(odict_exp, odict_act)
+    while True:
+        # Compared column by column, a chunk of records at a time to stay within the memory of a spilled section
+        compared = list(itertools.islice(compared_items, chunk_size))
+        if not compared:
+            break
+        chunk_records = compare_report_records_by_column(compared, index_exp, index_act, numpy)
+        if chunk_records is None:
+            chunk_records = []
+            for exp_row_key, exp_row_val, act_row_val in compared:
+                data_mismatch_flag, data_error_message = compare_report_data_dicts(exp_row_val, act_row_val,
+                                                                                   index_exp[exp_row_key].line_no,
+                                                                                   index_act[exp_row_key].line_no,
+                                                                                   exp_row_key)
+                chunk_records.append((index_exp[exp_row_key].position, data_mismatch_flag, data_error_message))
+        chunk_records, chunk_matching_records = _split_compared_records(chunk_records)
+        deviating_records += chunk_records
+        matching_records += chunk_matching_records
+    if compared_records:
+        deviating_records = list(merge(deviating_records, compared_records, key=itemgetter(0)))
+    if duplicate_records is not None:
+        position = itemgetter(0)
+        present_in_exp_absent_in_act = list(merge(present_in_exp_absent_in_act, duplicate_records[0], key=position))
+        present_in_act_absent_in_exp = list(merge(present_in_act_absent_in_exp, duplicate_records[1], key=position))
+        compared_records, duplicate_matching_records = _split_compared_records(duplicate_records[2])
+        deviating_records = list(merge(deviating_records, compared_records, key=position))
+        matching_records += duplicate_matching_records
+    return present_in_exp_absent_in_act, present_in_act_absent_in_exp, deviating_records, matching_records
+
+
+def _get_compare_chunk_size(odict_exp, odict_act):
+    # Records of a spilled section are compared in chunks holding about as many bytes of records of either report
+    # as its SpillableRecordStore kept in memory, other sections in chunks of compare_chunk_size records
+    chunk_size = compare_chunk_size
+    for odict in [odict_exp, odict_act]:
+        if isinstance(odict, SpillableRecordStore) and odict.spilled_record_size is not None:
+            chunk_size = min(chunk_size, max(1, int(odict.memory_budget / odict.spilled_record_size)))
+    return chunk_size
+
+
+def _split_compared_records(compared_records):
+    # Records present in both reports with deviations, and the number of those without
+    deviating_records = [compared_record for compared_record in compared_records if not compared_record[1]]
+    return deviating_records, len(compared_records) - len(deviating_records)
+
+
+def _iter_unique_key_records(odict, duplicate_keys):
+    if not duplicate_keys:
+        return odict.items()
+    return ((key, record) for key, record in odict.items() if get_record_key(key) not in duplicate_keys)
+
+
+def compare_duplicate_records(duplicate_keys, odict_exp, odict_act, index_exp, index_act):
+    """
+    This method compares the records of keys shared by several records in either report, see
+    pair_duplicate_records.
+    :param duplicate_keys: Record keys shared by several records in Expected or Actual report
+    :return: Lists of (position, record) missing in Actual, (position, record) missing in Expected and
+             (position, data_mismatch_flag, data_error_message) for paired records, sorted by position
+    """
+    present_in_exp_absent_in_act = []
+    present_in_act_absent_in_exp = []
+    compared_records = []
+    for record_key in duplicate_keys:
+        exp_keys = _get_occurrence_keys(record_key, odict_exp)
+        act_keys = _get_occurrence_keys(record_key, odict_act)
+        exp_records = [(odict_exp.get(key), index_exp[key]) for key in exp_keys]
+        act_records = [(odict_act.get(key), index_act[key]) for key in act_keys]
+        paired_records, exp_unpaired, act_unpaired = pair_duplicate_records(record_key, exp_records, act_records)
+        for exp_no, act_no, data_mismatch_flag, data_error_message in paired_records:
+            compared_records.append((exp_records[exp_no][1].position, data_mismatch_flag, data_error_message))
+        for exp_no in exp_unpaired:
+            record, row_position = exp_records[exp_no]
+            present_in_exp_absent_in_act.append((row_position.position, _get_absent_record_deviation(
+                record_key, record, row_position.line_no, 'Actual')))
+        for act_no in act_unpaired:
+            record, row_position = act_records[act_no]
+            present_in_act_absent_in_exp.append((row_position.position, _get_absent_record_deviation(
+                record_key, record, row_position.line_no, 'Expected')))
+    position = itemgetter(0)
+    return sorted(present_in_exp_absent_in_act, key=position), sorted(present_in_act_absent_in_exp, key=position), \
+        sorted(compared_records, key=position)
+
+
+def _get_occurrence_keys(record_key, odict):
+    occurrence_keys = []
+    key = record_key
+    while key in odict:
+        occurrence_keys.append(key)
+        key = _get_occurrence_key(record_key, len(occurrence_keys) + 1)
+    return occurrence_keys
+
+
+def pair_duplicate_records(record_key, exp_records, act_records):
+    """
+    This method pairs the Expected and Actual records sharing a key, deterministically: first the records at the
+    same occurrence of the key in both reports that compare without deviations, then the remaining records by
+    fewest differing cells, earlier records first on a tie.
+    :param record_key: Key of the records
+    :param exp_records: List of (record, RowPosition) of Expected report, in report order
+    :param act_records: List of (record, RowPosition) of Actual report, in report order
+    :return: List of (Expected record no, Actual record no, data_mismatch_flag, data_error_message) of the paired
+             records, and lists of the record nos of unpaired Expected and Actual records
+    """
+    comparisons = {}
+
+    def compare(exp_no, act_no):
+        if (exp_no, act_no) not in comparisons:
+            (exp_record, exp_position), (act_record, act_position) = exp_records[exp_no], act_records[act_no]
+            comparisons[exp_no, act_no] = compare_report_data_dicts(exp_record, act_record, exp_position.line_no,
+                                                                    act_position.line_no, record_key)
+        return comparisons[exp_no, act_no]
+
+    paired_records = []
+    exp_unpaired = list(range(len(exp_records)))
+    act_unpaired = list(range(len(act_records)))
+    for record_no in range(min(len(exp_records), len(act_records))):
+        data_mismatch_flag, data_error_message = compare(record_no, record_no)
+        if data_mismatch_flag:
+            paired_records.append((record_no, record_no, data_mismatch_flag, data_error_message))
+            exp_unpaired.remove(record_no)
+            act_unpaired.remove(record_no)
+    candidate_pairs = sorted((len(compare(exp_no, act_no)[1]), exp_no, act_no)
+                             for exp_no in exp_unpaired for act_no in act_unpaired)
+    for differing_cells, exp_no, act_no in candidate_pairs:
+        if exp_no in exp_unpaired and act_no in act_unpaired:
+            paired_records.append((exp_no, act_no) + compare(exp_no, act_no))
+            exp_unpaired.remove(exp_no)
+            act_unpaired.remove(act_no)
+    return sorted(paired_records), exp_unpaired, act_unpaired
+
+
+def _get_report_data_messages(present_in_exp_absent_in_act, present_in_act_absent_in_exp, compared_records,
+                              matching_records=0):
     data_error_messages = []
     data_mismatch_flags = []
-    present_in_exp_absent_in_act = find_missing_records(odict_exp, odict_act)
-    present_in_act_absent_in_exp = find_missing_records(odict_act, odict_exp)
+    present_in_exp_absent_in_act = [deviation for position, deviation in present_in_exp_absent_in_act]
+    present_in_act_absent_in_exp = [deviation for position, deviation in present_in_act_absent_in_exp]
     if len(present_in_exp_absent_in_act) != 0:
-        present_in_exp_absent_in_act_message = _get_list_data_as_string(present_in_exp_absent_in_act)
-        data_error_messages.append(
-            f"Records present in Expected report but absent in Actual report:{present_in_exp_absent_in_act_message}")
+        present_in_exp_absent_in_act_message = _get_list_data_as_string(
+            [deviation.expected for deviation in present_in_exp_absent_in_act])
+        data_error_messages.append(DeviationMessage(
+            f"Records present in Expected report but absent in Actual report:{present_in_exp_absent_in_act_message}",
+            present_in_exp_absent_in_act))
     if len(present_in_act_absent_in_exp) != 0:
-        present_in_act_absent_in_exp_message = _get_list_data_as_string(present_in_act_absent_in_exp)
-        data_error_messages.append(
-            f"Records present in Actual report but absent in Expected report:{present_in_act_absent_in_exp_message}")
+        present_in_act_absent_in_exp_message = _get_list_data_as_string(
+            [deviation.actual for deviation in present_in_act_absent_in_exp])
+        data_error_messages.append(DeviationMessage(
+            f"Records present in Actual report but absent in Expected report:{present_in_act_absent_in_exp_message}",
+            present_in_act_absent_in_exp))
+    if present_in_exp_absent_in_act or present_in_act_absent_in_exp:
+        # Records absent in one of the reports fail the comparison, check_sort_order only checks common records
+        data_mismatch_flags.append(False)
     data_error_messages.append(f"Comparison summary for Report records:")
-    for exp_row_key, exp_row_val in odict_exp.items():
-        if exp_row_key in odict_act.keys():
-            data_mismatch_flag, data_error_message = compare_report_data_dicts(exp_row_val, odict_act.get(exp_row_key),
-                                                                               list(odict_exp).index(
-                                                                                   exp_row_key) + exp_section_start,
-                                                                               list(odict_act).index(
-                                                                                   exp_row_key) + act_section_start)
-            data_error_messages.append(data_error_message)
-            data_mismatch_flags.append(data_mismatch_flag)
+    # Records compared without deviations have no messages and count as passed
+    passed_records = matching_records
+    for position, data_mismatch_flag, data_error_message in compared_records:
+        data_error_messages.append(data_error_message)
+        passed_records += 1 if data_mismatch_flag else 0
+    data_mismatch_flags.append(FlagCounts(passed_records, len(compared_records) + matching_records - passed_records))
 
     return data_mismatch_flags, data_error_messages
 
 
-def check_sort_order(lst_exp, lst_act):
-    if set(lst_exp) != set(lst_act):
-        return [False], ["Sort order in current section of Expected and Actual report is NOT MATCHING"]
+def check_sort_order(odict_exp, odict_act, index_exp=None, index_act=None):
+    """
+    This method checks the order of the records present in both reports; records missing in one of them are
+    reported by compare_report_data and do not count here. Records of Actual report outside a longest subsequence
+    in Expected report order are the minimal set of records out of place.
+    :param index_exp: Key -> RowPosition mapping of Expected report
+    :param index_act: Key -> RowPosition mapping of Actual report
+    :return: Sort order flag and messages of the section: when records are out of place, a Sort_Order_Deviation
+             with the first divergence point (expected and actual are the keys found there), followed by a
+             Sort_Order_Deviation per record out of place (expected and actual are its positions in the reports)
+    """
+    if index_exp is None or index_act is None:
+        return [True], ["Sort order in current section of Expected and Actual report is MATCHING"]
+    # Keys present in both reports, in Actual report order, and their RowPosition in Expected report, read again
+    # on every pass instead of being collected for sections spilled to disk
+    common_records = partial(_iter_common_records, odict_exp, odict_act, index_exp)
+    previous_position = -1
+    for key, exp_row_position in common_records():
+        if exp_row_position.position < previous_position:
+            break
+        previous_position = exp_row_position.position
     else:
         return [True], ["Sort order in current section of Expected and Actual report is MATCHING"]
+    positions = array('q', (exp_row_position.position for key, exp_row_position in common_records()))
+    out_of_place = find_out_of_place_records(positions)
+
+    # Up to the first divergence, positions are the smallest ones in increasing order, so the position expected
+    # there is the smallest one from there on
+    suffix_minima = array('q', itertools.accumulate(reversed(positions), min))
+    suffix_minima.reverse()
+    divergence, expected_position = next((record_no, minimum) for record_no, (position, minimum)
+                                         in enumerate(zip(positions, suffix_minima)) if position != minimum)
+    del suffix_minima
+    expected_record_no = positions.index(expected_position)
+    record_nos = set(out_of_place)
+    record_nos.update([divergence, expected_record_no])
+    common_keys = {record_no: key for record_no, (key, exp_row_position) in enumerate(common_records())
+                   if record_no in record_nos}
+    expected_key = common_keys[expected_record_no]
+    exp_line_no = index_exp[expected_key].line_no
+    act_line_no = index_act[common_keys[divergence]].line_no
+    msg = f"Sort order in current section of Expected and Actual report is NOT MATCHING | First divergence: " \
+          f"Line in Expected report: {exp_line_no} ; Line in Actual report: {act_line_no} | " \
+          f"Records out of place: {len(out_of_place)}"
+    sort_order_messages = [Deviation('Sort_Order_Deviation', expected=get_record_key(expected_key),
+                                     actual=get_record_key(common_keys[divergence]),
+                                     exp_line_no=exp_line_no, act_line_no=act_line_no, message=msg)]
+    for record_no in out_of_place:
+        key = common_keys[record_no]
+        act_row_position = index_act[key]
+        exp_line_no = index_exp[key].line_no
+        act_line_no = act_row_position.line_no
+        msg = f"Sort_Order_Deviation | Line in Expected report: {exp_line_no} ; Line in Actual report: {act_line_no} " \
+              f"| Record out of place in Actual report"
+        sort_order_messages.append(Deviation('Sort_Order_Deviation', key=get_record_key(key),
+                                             expected=positions[record_no],
+                                             actual=act_row_position.position, exp_line_no=exp_line_no,
+                                             act_line_no=act_line_no, message=msg))
+    return [False], sort_order_messages
+
+
+def _iter_common_records(odict_exp, odict_act, index_exp):
+    if isinstance(odict_act, SpillableRecordStore) and isinstance(odict_exp, SpillableRecordStore):
+        return odict_act.iter_common_records(odict_exp)
+    return ((key, index_exp[key]) for key in odict_act if key in odict_exp)
+
+
+def find_out_of_place_records(positions):
+    """
+    This method finds the fewest elements to move for positions to be increasing, i.e. those outside a longest
+    increasing subsequence of it, in O(n log n).
+    :param positions: Distinct positions in Expected report of records, in Actual report order
+    :return: Sorted list of indexes into positions of the elements out of place
+    """
+    if all(map(lt, positions, itertools.islice(positions, 1, None))):
+        return []
+    # tail_positions[length - 1] is the smallest last position of an increasing subsequence of that length, and
+    # tail_indexes[length - 1] its index; arrays of machine integers, as they are as long as the section
+    tail_positions = array('q')
+    tail_indexes = array('q')
+    predecessors = array('q', [-1]) * len(positions)
+    for position_no, position in enumerate(positions):
+        length = bisect_left(tail_positions, position)
+        if length:
+            predecessors[position_no] = tail_indexes[length - 1]
+        if length == len(tail_positions):
+            tail_positions.append(position)
+            tail_indexes.append(position_no)
+        else:
+            tail_positions[length] = position
+            tail_indexes[length] = position_no
+    in_order = bytearray(len(positions))
+    position_no = tail_indexes[-1] if tail_indexes else -1
+    while position_no != -1:
+        in_order[position_no] = 1
+        position_no = predecessors[position_no]
+    return [position_no for position_no, flag in enumerate(in_order) if not flag]
 
 
 def compare_report_data_attributes(expected, actual, exp_headers, act_headers, exp_section_start, act_section_start,
-                                   section_title):
+                                   section_title, exp_line_numbers=None, act_line_numbers=None, executor=None,
+                                   partitions=1, options=None, exp_keyed=None, act_keyed=None, reused_records=None):
+    with profile_stage('get_data_for_sort_order_validation', section_title) as stage_counts:
+        if exp_keyed is not None:
+            # Already keyed by key_report_sections, e.g. a cached baseline report
+            odict_exp, index_exp = exp_keyed
+        else:
+            lst_exp, odict_exp, index_exp = get_data_for_sort_order_validation(expected, exp_headers,
+                                                                               exp_line_numbers, exp_section_start)
+        if act_keyed is not None:
+            odict_act, index_act = act_keyed
+        else:
+            lst_act, odict_act, index_act = get_data_for_sort_order_validation(actual, act_headers,
+                                                                               act_line_numbers, act_section_start)
+        if stage_counts is not None:
+            stage_counts.rows = (0 if exp_keyed is not None else len(expected)) + \
+                                (0 if act_keyed is not None else len(actual))
+    return compare_keyed_report_data(len(expected), len(actual), odict_exp, odict_act, index_exp, index_act,
+                                     section_title, executor, partitions, options, reused_records)
+
+
+def compare_keyed_report_data(exp_record_count, act_record_count, odict_exp, odict_act, index_exp, index_act,
+                              section_title, executor=None, partitions=1, options=None, reused_records=None):
     data_error_messages = []
     data_mismatch_flags = []
-    if len(expected) != len(actual):
-        msg = f"Record_Count_Deviation | Section Title: [ {section_title} ] | Expected Record count: [{len(expected)}] | Actual Record count: [{len(actual)}]"
-        data_error_messages.append(msg)
+    if exp_record_count != act_record_count:
+        msg = f"Record_Count_Deviation | Section Title: [ {section_title} ] | Expected Record count: [{exp_record_count}] | Actual Record count: [{act_record_count}]"
+        data_error_messages.append(Deviation('Record_Count_Deviation', section_title, expected=exp_record_count,
+                                             actual=act_record_count, message=msg))
         data_mismatch_flags.append(False)
-    lst_exp, odict_exp = get_data_for_sort_order_validation(expected, exp_headers)
-    lst_act, odict_act = get_data_for_sort_order_validation(actual, act_headers)
-    data_mismatch_flag, data_error_message = compare_report_data(odict_exp, odict_act, exp_section_start,
-                                                                 act_section_start)
+    exp_duplicates = get_duplicate_key_index(odict_exp)
+    act_duplicates = get_duplicate_key_index(odict_act)
+    if exp_duplicates or act_duplicates:
+        data_error_messages.append(_get_duplicate_key_count(section_title, exp_duplicates, act_duplicates))
+    with profile_stage('compare_report_data', section_title) as stage_counts:
+        data_mismatch_flag, data_error_message = compare_report_data(odict_exp, odict_act, index_exp, index_act,
+                                                                     executor, partitions, options, reused_records,
+                                                                     exp_duplicates.keys() | act_duplicates.keys())
+        if stage_counts is not None:
+            stage_counts.rows = len(odict_exp) + len(odict_act)
+            stage_counts.cells = _count_compared_cells(odict_exp, data_mismatch_flag, reused_records)
     data_mismatch_flags.append(data_mismatch_flag)
     data_error_messages.append(data_error_message)
 
-    data_mismatch_flag, data_error_message = check_sort_order(lst_exp, lst_act)
+    with profile_stage('check_sort_order', section_title) as stage_counts:
+        data_mismatch_flag, data_error_message = check_sort_order(odict_exp, odict_act, index_exp, index_act)
+        if stage_counts is not None:
+            stage_counts.rows = len(odict_exp) + len(odict_act)
     data_mismatch_flags.append(data_mismatch_flag)
     data_error_messages.append(data_error_message)
 
     return data_mismatch_flags, data_error_messages
 
 
-def compare_reports(map_1, map_2):
+def _get_duplicate_key_count(section_title, exp_duplicates, act_duplicates):
+    exp_records = sum(len(occurrence_keys) for occurrence_keys in exp_duplicates.values())
+    act_records = sum(len(occurrence_keys) for occurrence_keys in act_duplicates.values())
+    msg = f"Duplicate_Key_Count | Section Title: [ {section_title} ] | Expected report: [{exp_records}] records " \
+          f"sharing [{len(exp_duplicates)}] keys | Actual report: [{act_records}] records sharing " \
+          f"[{len(act_duplicates)}] keys"
+    return DuplicateKeyCount(section_title, exp_records, len(exp_duplicates), act_records, len(act_duplicates), msg)
+
+
+def _count_compared_cells(odict_exp, data_mismatch_flags, reused_records=None):
+    # Records present in both reports are compared over the columns of Expected report not in skip_columns
+    compared_records = sum(flag_counts.passed + flag_counts.failed for flag_counts in data_mismatch_flags
+                           if isinstance(flag_counts, FlagCounts))
+    if reused_records:
+        compared_records -= sum(1 for key in reused_records if key in odict_exp)
+    if compared_records <= 0:
+        return 0
+    key, record = next(iter(odict_exp.items()))
+    return compared_records * sum(1 for column in record if column not in skip_columns)
+
+
+def compare_reports(map_1, map_2, workers=1, options=None, comparison_result=None, reused_records=None):
+    """
+    This method compares sections of Expected and Actual reports read by read_report_sections_in_dict.
+    :param map_1: Sections of Expected report
+    :param map_2: Sections of Actual report
+    :param workers: Number of worker processes; sections are compared in parallel when more than 1, and sections
+                    larger than large_section_record_count are split into key-hash partitions across the workers
+    :param options: ComparisonOptions
+    :param comparison_result: If given, ComparisonResult the flags and messages of every section are added to as
+                              soon as the section is compared, instead of being returned
+    :param reused_records: Optional dict of section header string -> reused records of the section, see
+                           get_reused_records
+    :return: Comparison flags and messages, in section order
+    """
     master_comparison_flag_list = []
     error_messages = []
+    map_2 = match_report_sections(map_1, map_2)
+    add_section_digests(map_1, map_2)
+    identical_data = is_report_data_identical(map_1, map_2)
     # Compare report sections fisrt
-    section_comparison_flag, error_message = compare_report_sections(map_1, map_2)
-    error_messages.append(error_message)
+    section_comparison_flag, error_message = compare_report_sections(map_1, map_2, identical_data)
+    if comparison_result is None:
+        error_messages.append(error_message)
+    else:
+        comparison_result.identical_data = identical_data
+        comparison_result.add_flags([section_comparison_flag])
+        comparison_result.add_messages([error_message])
     master_comparison_flag_list.append(section_comparison_flag)
 
-    # Compare Headers and Data
-    for map_1_header_str, map_1_section_meta_data in map_1.items():
-        # Check if key from Actual dict is present in Expected dict
-        if map_1_header_str in map_2.keys():
-            map_2_section_meta_data = map_2.get(map_1_header_str)
+    # Sections of identical reports are all skipped, no worker processes are needed for them
+    executor = _create_process_pool(workers) if workers > 1 and not identical_data else None
+    try:
+        # Compare Headers and Data
+        section_titles = []
+        section_results = []
+        large_sections = []
+        for map_1_header_str, map_1_section_meta_data in map_1.items():
+            # Check if key from Actual dict is present in Expected dict
+            if map_1_header_str in map_2.keys():
+                map_2_section_meta_data = map_2.get(map_1_header_str)
+
+                # Extract the Column headers and Report data from both the dicts
+                map_1_headers = map_1_section_meta_data.header
+                map_2_headers = map_2_section_meta_data.header
+                map_1_rpt_section = map_1_section_meta_data.rpt_section
+                map_2_rpt_section = map_2_section_meta_data.rpt_section
+
+                compare_data = partial(compare_report_data_attributes, map_1_rpt_section, map_2_rpt_section,
+                                       map_1_headers, map_2_headers,
+                                       map_1_section_meta_data.section_start,
+                                       map_2_section_meta_data.section_start,
+                                       map_1_header_str,
+                                       map_1_section_meta_data.row_line_no,
+                                       map_2_section_meta_data.row_line_no, options=options,
+                                       exp_keyed=map_1_section_meta_data.keyed,
+                                       act_keyed=map_2_section_meta_data.keyed,
+                                       reused_records=None if reused_records is None
+                                       else reused_records.get(map_1_header_str))
+                section_titles.append(map_1_header_str)
+                if is_section_data_identical(map_1_section_meta_data, map_2_section_meta_data):
+                    section_results.append(compare_report_section(map_1_header_str, map_1_headers, map_2_headers,
+                                                                  compare_identical_report_data))
+                elif executor is None:
+                    section_results.append(compare_report_section(map_1_header_str, map_1_headers, map_2_headers,
+                                                                  compare_data))
+                elif max(len(map_1_rpt_section), len(map_2_rpt_section)) > large_section_record_count:
+                    # Keyed in this process and compared partition-wise once the smaller sections are queued
+                    compare_data = partial(compare_data, executor=executor, partitions=workers)
+                    large_sections.append((len(section_results), map_1_header_str, map_1_headers, map_2_headers,
+                                           compare_data))
+                    section_results.append(None)
+                else:
+                    section_results.append(_submit_section_comparison(executor, map_1_header_str, map_1_headers,
+                                                                      map_2_headers, compare_data))
+                if executor is None and comparison_result is not None:
+                    _add_section_result(comparison_result, section_titles.pop(), section_results.pop(),
+                                        master_comparison_flag_list)
+
+        for section_no, map_1_header_str, map_1_headers, map_2_headers, compare_data in large_sections:
+            section_results[section_no] = compare_report_section(map_1_header_str, map_1_headers, map_2_headers,
+                                                                 compare_data)
+
+        for section_title, section_result in zip(section_titles, section_results):
+            if comparison_result is not None:
+                _add_section_result(comparison_result, section_title, section_result, master_comparison_flag_list)
+                continue
+            section_flags, section_messages = section_result if isinstance(section_result, tuple) \
+                else _get_profiled_result(section_result.result())
+            master_comparison_flag_list += section_flags
+            error_messages += section_messages
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
-            # Extract the Column headers and Report data from both the dicts
-            map_1_headers = map_1_section_meta_data.header
-            map_2_headers = map_2_section_meta_data.header
-            map_1_rpt_section = map_1_section_meta_data.rpt_section
-            map_2_rpt_section = map_2_section_meta_data.rpt_section
+    return master_comparison_flag_list, error_messages
 
-            msg = ["*" * 100]
-            msg += [f"Data comparison started for section:\n[{map_1_header_str}]"]
-            error_messages.append(msg)
-
-            # Compare column header and get the differences in a list
-            column_compare_result, error_message = compare_report_header(map_1_headers, map_2_headers)
-            error_messages.append(error_message)
-            master_comparison_flag_list.append(column_compare_result)
-
-            # Compare report data from section
-            data_compare_result, error_message = compare_report_data_attributes(map_1_rpt_section, map_2_rpt_section,
-                                                                                map_1_headers, map_2_headers,
-                                                                                map_1_section_meta_data.section_start,
-                                                                                map_2_section_meta_data.section_start,
-                                                                                map_1_header_str)
-            error_messages.append(error_message)
-            master_comparison_flag_list.append(data_compare_result)
-            msg = [f"Data comparison Finished for section\n"]
-            msg += ["*" * 100]
-            error_messages.append(msg)
 
-    return master_comparison_flag_list, error_messages
+def compare_report_section(section_title, map_1_headers, map_2_headers, compare_data):
+    """
+    This method compares column headers and data of one report section present in both reports.
+    :param section_title: Header string of the section
+    :param map_1_headers: Column header of the section in Expected report
+    :param map_2_headers: Column header of the section in Actual report
+    :param compare_data: Callable returning (data_mismatch_flags, data_error_messages) for the section data
+    :return: Comparison flags and messages of the section
+    """
+    section_flags = []
+    section_messages = []
+    msg = ["*" * 100]
+    msg += [f"Data comparison started for section:\n[{section_title}]"]
+    section_messages.append(msg)
+
+    # Compare column header and get the differences in a list
+    column_compare_result, error_message = compare_report_header(map_1_headers, map_2_headers)
+    section_messages.append(error_message)
+    section_flags.append(column_compare_result)
+
+    # Compare report data from section
+    data_compare_result, error_message = compare_data()
+    section_messages.append(error_message)
+    section_flags.append(data_compare_result)
+    msg = [f"Data comparison Finished for section\n"]
+    msg += ["*" * 100]
+    section_messages.append(msg)
+    return section_flags, section_messages
+
+
+class _OffsetLineReader:
+    """
+    Iterates decoded lines of a report opened in binary mode, keeping the byte offset of the next unread line,
+    so that the start of every csv record can be remembered and seeked to later.
+    """
+
+    def __init__(self, binary_file, encoding):
+        self.binary_file = binary_file
+        self.encoding = encoding
+        self.offset = binary_file.tell()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.binary_file.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode(self.encoding).replace('\r\n', '\n')
+
+
+def _get_raw_row_pattern(encoding=None):
+    # One CSV record: like csv.reader, a quote opens a quoted value only at the start of a value, elsewhere it is
+    # a literal character. Quoted values (doubled quotes being two adjacent ones) may span lines, and characters
+    # after the closing quote belong to the value. The optional lookahead captures rows whose first value may be
+    # one of skip_row_values, without consuming anything
+    encoding = encoding or locale.getpreferredencoding(False)
+    skip_values = b'|'.join(re.escape(value.encode(encoding)) for value in skip_row_values) or b'(?!)'
+    return re.compile(rb'(?:(?=(?P<skip>"?(?:' + skip_values + rb')"?(?:,|\r?\n|\Z))))?' +
+                      _raw_value_pattern + rb'(?:,' + _raw_value_pattern + rb')*+(?:\n|\Z)')
+
+
+def _get_raw_rows_pattern():
+    # Any number of CSV records that are not blank lines, see _get_raw_row_pattern
+    return re.compile(rb'(?:(?!\r?\n|\Z)' + _raw_value_pattern + rb'(?:,' + _raw_value_pattern +
+                      rb')*+(?:\n|\Z))*+')
+
+
+def _decode_raw_row(data, start, end, encoding):
+    return next(csv.reader(io.TextIOWrapper(io.BytesIO(data[start:end]), encoding=encoding)), [])
+
+
+def index_report_sections(fileName):
+    """
+    This method finds the report sections without keeping their records in memory, scanning the raw bytes of the
+    report: only section headers and rows that may be skippable or a no-data banner are decoded, to be checked
+    with is_row_skippable and is_row_col_val_conv_req. Sections are delimited and keyed the same way as in
+    read_report_sections_in_dict.
+    :param fileName: CSV report
+    :return: OrderedDict of section header string -> SectionIndex(section_start, header, offset, record_count,
+             digest, end), where offset and end are the byte offsets of the section header and of the end of the
+             section, and digest is a hash of the raw bytes in between (None for sections within the first 3
+             lines, as their leading rows are not records)
+    """
+    with profile_stage('index_report_sections', fileName) as stage_counts:
+        rpt_section_dict = _index_report_sections(fileName)
+        if stage_counts is not None:
+            stage_counts.rows = sum(section_index.record_count for section_index in rpt_section_dict.values())
+    return rpt_section_dict
+
+
+def _index_report_sections(fileName):
+    rpt_section_dict = OrderedDict()
+    if os.path.getsize(fileName) == 0:
+        return rpt_section_dict
+    encoding = locale.getpreferredencoding(False)
+    row_pattern = _get_raw_row_pattern(encoding)
+    banner_pattern = re.compile(b'|'.join(re.escape(banner.encode(encoding)) for banner in no_data_banners) or b'(?!)')
+
+    with open(fileName, mode='rb') as csv_file, mmap.mmap(csv_file.fileno(), 0, access=mmap.ACCESS_READ) as data, \
+            memoryview(data) as data_view:
+        banner_positions = [match.start() for match in banner_pattern.finditer(data)]
+        banner_no = 0
+        line_no = 1
+        section_index = None
+        header_str_key = None
+        record_count = 0
+        for match in row_pattern.finditer(data):
+            row_start, row_end = match.span()
+            if row_start == len(data):
+                break
+            if row_end - row_start <= 2 and data[row_start:row_end].strip(b'\r\n') == b'':
+                if section_index is not None:
+                    rpt_section_dict[header_str_key] = _get_scanned_section_index(section_index, record_count,
+                                                                                  row_start, data_view)
+                section_index = None
+            else:
+                while banner_no < len(banner_positions) and banner_positions[banner_no] < row_start:
+                    banner_no += 1
+                if section_index is None or match.start('skip') != -1 or \
+                        (banner_no < len(banner_positions) and banner_positions[banner_no] < row_end):
+                    row = _decode_raw_row(data, row_start, row_end, encoding)
+                    row_skippable = is_row_skippable(row)
+                    row_conv_req = is_row_col_val_conv_req(line_no, row)
+                else:
+                    row_skippable = False
+                    row_conv_req = line_no > 3
+                if not row_skippable:
+                    if section_index is None:
+                        section_index = SectionIndex(line_no, row, row_start, 0)
+                        header_str_key = '|'.join(str(column).strip() for column in row)
+                        rpt_section_dict[header_str_key] = section_index
+                        record_count = 0
+                    if row_conv_req:
+                        record_count += 1
+            line_no += 1
+
+        if section_index is not None:
+            rpt_section_dict[header_str_key] = _get_scanned_section_index(section_index, record_count, len(data),
+                                                                          data_view)
+    return rpt_section_dict
+
+
+def get_decoded_section_index(fileName, section_index):
+    """
+    This method reads the records of a section found by index_report_sections.
+    :return: SectionIndex with the SectionDigest of the records as digest, instead of the raw digest
+    """
+    section_digest = SectionDigest(section_index.header)
+    for line_no, record in iter_section_records(fileName, section_index):
+        section_digest.update(record)
+    return section_index._replace(digest=section_digest.hexdigest())
+
+
+def _get_scanned_section_index(section_index, record_count, end, data_view):
+    digest = None
+    if section_index.section_start > 3:
+        digest = f"raw:{hashlib.sha1(data_view[section_index.offset:end]).hexdigest()}"
+    return section_index._replace(record_count=record_count, digest=digest, end=end)
+
+
+def read_report_pair_sections(expected, actual):
+    """
+    This method reads the sections of both reports like read_report_sections_in_dict, except for sections whose
+    raw bytes are the same in both reports (see index_report_sections): those are not decoded at all. Their
+    SectionMetaData has no records and the raw digest as digest, so that compare_reports skips them as identical.
+    :return: Sections of Expected report and sections of Actual report
+    """
+    exp_section_index = index_report_sections(expected)
+    act_section_index = index_report_sections(actual)
+    identical_sections = {header_str_key for header_str_key, section_index in exp_section_index.items()
+                          if section_index.digest is not None and header_str_key in act_section_index
+                          and act_section_index[header_str_key].digest == section_index.digest}
+    result = []
+    for fileName, section_indexes in [(expected, exp_section_index), (actual, act_section_index)]:
+        with profile_stage('read_report_pair_sections', fileName) as stage_counts:
+            result.append(_read_indexed_report_sections(fileName, section_indexes, identical_sections))
+            if stage_counts is not None:
+                stage_counts.rows = _count_section_records(result[-1])
+    return result
+
+
+def _read_indexed_report_sections(fileName, section_indexes, skipped_sections):
+    rpt_section_dict = OrderedDict()
+    if not section_indexes:
+        return rpt_section_dict
+    encoding = locale.getpreferredencoding(False)
+    with open(fileName, mode='rb') as csv_file, mmap.mmap(csv_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for header_str_key, section_index in section_indexes.items():
+            if header_str_key in skipped_sections:
+                rpt_section_dict[header_str_key] = SectionMetaData(section_index.section_start, section_index.header,
+                                                                   [], [], section_index.digest)
+            else:
+                section_file = io.TextIOWrapper(io.BytesIO(data[section_index.offset:section_index.end]),
+                                                encoding=encoding)
+                rpt_section_dict.update(_read_report_sections(section_file, section_index.section_start)[0])
+    return rpt_section_dict
+
+
+def iter_section_records(fileName, section_index):
+    """
+    This method reads the records of one report section found by index_report_sections.
+    :param fileName: CSV report
+    :param section_index: SectionIndex of the section
+    :return: Generator of (line_no, record) pairs
+    """
+    line_no = section_index.section_start
+    section_columns = SectionColumns(section_index.header)
+    with open(fileName, mode='rb') as csv_file:
+        csv_file.seek(section_index.offset)
+        csv_reader = csv.reader(_OffsetLineReader(csv_file, locale.getpreferredencoding(False)))
+        for row in csv_reader:
+            if row is None or not row:
+                break
+            if not is_row_skippable(row) and is_row_col_val_conv_req(line_no, row):
+                yield line_no, convert_row_to_col_val(section_columns, row)
+            line_no += 1
+
+
+def _estimate_record_size(key, row):
+    return sys.getsizeof(key) + sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row.values())
+
+
+class SpillableRecordStore:
+    """
+    Ordered key -> record mapping of one report section, with the same semantics as the OrderedDict built by
+    get_data_for_sort_order_validation. Records are kept in memory until their estimated size exceeds
+    memory_budget bytes, after which the store moves to a temporary sqlite file.
+    """
+
+    def __init__(self, memory_budget):
+        self.memory_budget = memory_budget
+        self.records = OrderedDict()
+        self.positions = {}
+        self.estimated_size = 0
+        self.connection = None
+        self.db_path = None
+        self.record_count = 0
+        self.key_counts = {}
+        self.columns = None
+        # Average estimated size of the records kept in memory until the store spilled
+        self.spilled_record_size = None
+
+    def add(self, key, row, line_no):
+        if self.connection is None:
+            if key in self.positions:
+                key = self._get_next_occurrence_key(key)
+            self.records[key] = row
+            self.positions[key] = RowPosition(len(self.positions), line_no)
+            self.estimated_size += _estimate_record_size(key, row)
+            if self.estimated_size > self.memory_budget:
+                self._spill()
+        elif not self._insert(key, row, line_no):
+            self._insert(self._get_next_occurrence_key(key), row, line_no)
+
+    def _get_next_occurrence_key(self, key):
+        # Records sharing a key are keyed like key_section_records does
+        key_count = self.key_counts.get(key, 1) + 1
+        self.key_counts[key] = key_count
+        return _get_occurrence_key(key, key_count)
+
+    def _dump_record(self, row):
+        if isinstance(row, ReportRecord):
+            # Only the cells are stored, the section columns are kept once in the store
+            self.columns = row.columns
+            row = row.cells
+        return pickle.dumps(row, pickle.HIGHEST_PROTOCOL)
+
+    def _load_record(self, row_blob):
+        row = pickle.loads(row_blob)
+        return row if self.columns is None else ReportRecord(self.columns, row)
+
+    def _insert(self, key, row, line_no):
+        row_blob = self._dump_record(row)
+        cursor = self.connection.execute("INSERT OR IGNORE INTO records VALUES (?, ?, ?, ?)",
+                                         (key, self.record_count, line_no, row_blob))
+        if cursor.rowcount:
+            self.record_count += 1
+        return cursor.rowcount != 0
+
+    def _spill(self):
+        import sqlite3
+        self.spilled_record_size = self.estimated_size / len(self.records)
+        fd, self.db_path = tempfile.mkstemp(prefix='csvcompare_', suffix='.sqlite')
+        os.close(fd)
+        self.connection = sqlite3.connect(self.db_path)
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute(
+            "CREATE TABLE records (key TEXT PRIMARY KEY, position INTEGER, line_no INTEGER, row BLOB)")
+        self.connection.execute("CREATE INDEX records_position ON records (position)")
+        for key, row in self.records.items():
+            self._insert(key, row, self.positions[key].line_no)
+        self.records = None
+        self.positions = None
+
+    @property
+    def index(self):
+        return self.positions if self.connection is None else _SpilledRecordIndex(self)
+
+    def position(self, key):
+        result = self.connection.execute("SELECT position, line_no FROM records WHERE key = ?", (key,)).fetchone()
+        if result is None:
+            raise KeyError(key)
+        return RowPosition(*result)
+
+    def get(self, key, default=None):
+        if self.connection is None:
+            return self.records.get(key, default)
+        result = self.connection.execute("SELECT row FROM records WHERE key = ?", (key,)).fetchone()
+        return default if result is None else self._load_record(result[0])
+
+    def items(self):
+        if self.connection is None:
+            return self.records.items()
+        return self._iter_spilled("SELECT key, row FROM records ORDER BY position",
+                                  lambda result: (result[0], self._load_record(result[1])))
+
+    def keys(self):
+        if self.connection is None:
+            return self.records.keys()
+        return self._iter_spilled("SELECT key FROM records ORDER BY position", lambda result: result[0])
+
+    def _iter_spilled(self, query, convert):
+        cursor = self.connection.execute(query)
+        while True:
+            results = cursor.fetchmany(1000)
+            if not results:
+                break
+            for result in results:
+                yield convert(result)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def iter_common_records(self, other):
+        """
+        This method iterates the keys of this store that other store has as well, in the order of this store.
+        When both stores are spilled, they are joined in sqlite instead of looking keys up one by one.
+        :return: Generator of (key, RowPosition in other store)
+        """
+        if self.connection is None or other.connection is None:
+            other_index = other.index
+            yield from ((key, other_index[key]) for key in self if key in other)
+            return
+        # The records inserted are committed for the join to see them, and for the join to be detached again
+        self.connection.commit()
+        other.connection.commit()
+        self.connection.execute("ATTACH DATABASE ? AS other", (other.db_path,))
+        cursor = self.connection.execute(
+            "SELECT records.key, other_records.position, other_records.line_no FROM records "
+            "JOIN other.records AS other_records ON other_records.key = records.key ORDER BY records.position")
+        try:
+            while True:
+                results = cursor.fetchmany(1000)
+                if not results:
+                    break
+                for key, position, line_no in results:
+                    yield key, RowPosition(position, line_no)
+        finally:
+            cursor.close()
+            self.connection.execute("DETACH DATABASE other")
+
+    def __contains__(self, key):
+        if self.connection is None:
+            return key in self.records
+        return self.connection.execute("SELECT 1 FROM records WHERE key = ?", (key,)).fetchone() is not None
+
+    def __len__(self):
+        return len(self.records) if self.connection is None else self.record_count
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            os.remove(self.db_path)
+            self.connection = None
+
+
+class _SpilledRecordIndex:
+    """Read-only key -> RowPosition view over a spilled SpillableRecordStore."""
+
+    def __init__(self, record_store):
+        self.record_store = record_store
+
+    def __getitem__(self, key):
+        return self.record_store.position(key)
+
+    def __contains__(self, key):
+        return key in self.record_store
+
+
+def compare_streamed_section_data(expected, actual, exp_section_index, act_section_index, section_title,
+                                  memory_budget, options=None):
+    """
+    This method compares data of one report section, reading its records from both reports on demand.
+    :param expected: Expected CSV report
+    :param actual: Actual CSV report
+    :param exp_section_index: SectionIndex of the section in Expected report
+    :param act_section_index: SectionIndex of the section in Actual report
+    :param section_title: Header string of the section
+    :param memory_budget: Bytes of keyed records kept in memory for the section before spilling to disk
+    :param options: ComparisonOptions
+    :return: Data comparison flags and messages of the section
+    """
+    exp_store = SpillableRecordStore(memory_budget // 2)
+    act_store = SpillableRecordStore(memory_budget // 2)
+    try:
+        with profile_stage('key_section_records', section_title) as stage_counts:
+            lst_exp, odict_exp, index_exp = key_section_records(iter_section_records(expected, exp_section_index),
+                                                                exp_section_index.header, exp_store)
+            lst_act, odict_act, index_act = key_section_records(iter_section_records(actual, act_section_index),
+                                                                act_section_index.header, act_store)
+            if stage_counts is not None:
+                stage_counts.rows = exp_section_index.record_count + act_section_index.record_count
+        return compare_keyed_report_data(exp_section_index.record_count, act_section_index.record_count,
+                                         odict_exp, odict_act, index_exp, index_act, section_title,
+                                         options=options)
+    finally:
+        exp_store.close()
+        act_store.close()
+
+
+def compare_reports_streaming(expected, actual, comparison_result, memory_budget, workers=1, options=None):
+    """
+    This method compares two reports one section at a time and adds the flags and messages of every section to
+    comparison_result as soon as the section is compared, so only one section is held in memory at once.
+    :param expected: Expected CSV report
+    :param actual: Actual CSV report
+    :param comparison_result: ComparisonResult the section results are added to
+    :param memory_budget: Bytes of keyed records kept in memory per section before spilling to disk
+    :param workers: Number of worker processes; when more than 1, each worker reads and compares whole sections
+                    with memory_budget / workers, and messages are still written in section order
+    :param options: ComparisonOptions
+    :return: Comparison flags, one per compared section
+    """
+    map_1 = index_report_sections(expected)
+    map_2 = match_report_sections(map_1, index_report_sections(actual))
+    for header_str_key, map_1_section_index in map_1.items():
+        map_2_section_index = map_2.get(header_str_key)
+        if map_2_section_index is not None and map_1_section_index.header == map_2_section_index.header \
+                and map_1_section_index.record_count == map_2_section_index.record_count \
+                and not is_section_data_identical(map_1_section_index, map_2_section_index):
+            # Sections may still compare without deviations when their normalised records are the same
+            map_1[header_str_key] = get_decoded_section_index(expected, map_1_section_index)
+            map_2[header_str_key] = get_decoded_section_index(actual, map_2[header_str_key])
+    master_comparison_flag_list = []
+
+    comparison_result.identical_data = is_report_data_identical(map_1, map_2)
+    section_comparison_flag, error_message = compare_report_sections(map_1, map_2, comparison_result.identical_data)
+    comparison_result.add_flags([section_comparison_flag])
+    comparison_result.add_messages([error_message])
+    master_comparison_flag_list.append(section_comparison_flag)
+
+    executor = _create_process_pool(workers) if workers > 1 and not comparison_result.identical_data else None
+    try:
+        section_titles = []
+        section_results = []
+        for map_1_header_str, map_1_section_index in map_1.items():
+            if map_1_header_str in map_2:
+                map_2_section_index = map_2.get(map_1_header_str)
+                section_titles.append(map_1_header_str)
+                if is_section_data_identical(map_1_section_index, map_2_section_index):
+                    compare_data = compare_identical_report_data
+                else:
+                    compare_data = partial(compare_streamed_section_data, expected, actual, map_1_section_index,
+                                           map_2_section_index, map_1_header_str, memory_budget // max(workers, 1),
+                                           options)
+                if executor is None or compare_data is compare_identical_report_data:
+                    section_results.append(compare_report_section(map_1_header_str, map_1_section_index.header,
+                                                                  map_2_section_index.header, compare_data))
+                else:
+                    section_results.append(_submit_section_comparison(executor, map_1_header_str,
+                                                                      map_1_section_index.header,
+                                                                      map_2_section_index.header, compare_data))
+                if executor is None:
+                    # Written right away, so that messages of only one section are held at a time
+                    _add_section_result(comparison_result, section_titles.pop(), section_results.pop(),
+                                        master_comparison_flag_list)
+
+        for section_title, section_result in zip(section_titles, section_results):
+            _add_section_result(comparison_result, section_title, section_result, master_comparison_flag_list)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return master_comparison_flag_list
+
+
+def _add_section_result(comparison_result, section_title, section_result, master_comparison_flag_list):
+    section_flags, section_messages = section_result if isinstance(section_result, tuple) \
+        else _get_profiled_result(section_result.result())
+    comparison_result.add_section(section_title, section_flags, section_messages)
+    master_comparison_flag_list.append(comparison_result.section_status[section_title])
 
 
 def compare_dict(map_1, map_2, map_1_name, map_2_name):
@@ -466,45 +2575,569 @@ def filter_summary(datalist):
 
 
 def check_false_in_result(lst):
-    flat_res = str(lst)
-    if 'False' in flat_res:
-        return False
-    else:
-        return True
+    passed_checks, failed_checks = count_flags(lst)
+    return failed_checks == 0
 
 
-def write_report_comparison_summary(flag_list, summary_messages, summary):
-    global success_msg, failure_msg
-    summary_file = open(summary, "w")
-    summary_file.write("*" * 100)
-    summary_file.write("\nReport Comparison Summary\n")
-    summary_file.write("*" * 100)
-    summary_file.write(f"\nOverall Comparison status:")
-    if check_false_in_result(flag_list):
-        summary_file.write(f"\n{success_msg}\n")
-        summary_file.write("*" * 100)
-    else:
-        summary_file.write(f"\n{failure_msg}\n")
-        summary_file.write("*" * 100)
-    if len(summary_messages) != 0:
-        for message in summary_messages:
-            if len(message) == 0:
-                continue
-            else:
+def count_flags(flag_list):
+    """
+    This method counts the comparison flags in a nested list of flags, which may hold FlagCounts.
+    :return: Number of passed (True) and failed (False) flags
+    """
+    passed_checks = 0
+    failed_checks = 0
+    flags = [flag_list]
+    while flags:
+        flag = flags.pop()
+        if isinstance(flag, FlagCounts):
+            passed_checks += flag.passed
+            failed_checks += flag.failed
+        elif isinstance(flag, (list, tuple)):
+            flags.extend(flag)
+        elif flag is not None and not flag:
+            failed_checks += 1
+        else:
+            passed_checks += 1
+    return passed_checks, failed_checks
+
+
+def write_report_comparison_summary(flag_list, summary_messages, summary, compress=False):
+    with SummaryWriter(summary, compress) as summary_writer:
+        summary_writer.write_messages(summary_messages)
+        summary_writer.add_flags(flag_list)
+
+
+class SummaryWriter:
+    """
+    Writes the Report Comparison summary while the reports are compared, so that summary messages are not
+    collected until the end. The overall status is known only once the last section is compared: a plain Summary
+    file has its status line reserved and filled in on close, a compressed one gets a gzip member with the status
+    written in front of the messages, which are compressed to a temporary file until then.
+    """
+
+    def __init__(self, summary, compress=False):
+        """
+        :param summary: Path of Summary file
+        :param compress: If True, Summary file is written gzip compressed
+        """
+        self.summary = summary
+        self.compress = compress
+        self.comparison_status = True
+        self._status_width = max(len(success_msg), len(failure_msg))
+        if compress:
+            self._compressed_messages = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(summary)))
+            self.summary_file = io.TextIOWrapper(gzip.GzipFile(fileobj=self._compressed_messages, mode='wb'))
+        else:
+            self.summary_file = open(summary, "w", buffering=summary_buffer_size)
+            self._status_position = _write_summary_status(self.summary_file, ' ' * self._status_width)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close(False if exc_type is not None else None)
+
+    def add_flags(self, flag_list):
+        self.comparison_status = self.comparison_status and check_false_in_result(flag_list)
+
+    def write_messages(self, summary_messages, section=None):
+        with profile_stage('write_report_comparison_summary', section):
+            for message in summary_messages:
                 for data in message:
                     if len(data) != 0:
                         if isinstance(data, list):
-                            enable_numbering = False
-                            summary_file.write(f"{_get_list_data_as_string(data, enable_numbering)}")
+                            for data_str in _iter_list_data_strings(data, False):
+                                self.summary_file.write(data_str)
                         else:
-                            summary_file.write(f"\n{str(data)}\n")
+                            self.summary_file.write(f"\n{str(data)}\n")
+
+    def close(self, comparison_status=None):
+        """
+        This method writes the overall status and closes the Summary file.
+        :param comparison_status: Status of the comparison, if not given by add_flags
+        """
+        if comparison_status is not None:
+            self.comparison_status = self.comparison_status and comparison_status
+        status_msg = (success_msg if self.comparison_status else failure_msg).ljust(self._status_width)
+        self.summary_file.write("*" * 100)
+        if self.compress:
+            self.summary_file.close()
+            with open(self.summary, "wb") as summary_file:
+                with io.TextIOWrapper(gzip.GzipFile(fileobj=summary_file, mode='wb')) as status_file:
+                    _write_summary_status(status_file, status_msg)
+                self._compressed_messages.seek(0)
+                shutil.copyfileobj(self._compressed_messages, summary_file)
+            self._compressed_messages.close()
+        else:
+            self.summary_file.seek(self._status_position)
+            self.summary_file.write(status_msg)
+            self.summary_file.close()
+
+
+def _write_summary_status(summary_file, status_msg):
     summary_file.write("*" * 100)
-    summary_file.close()
+    summary_file.write("\nReport Comparison Summary\n")
+    summary_file.write("*" * 100)
+    summary_file.write(f"\nOverall Comparison status:\n")
+    status_position = summary_file.tell()
+    summary_file.write(f"{status_msg}\n")
+    summary_file.write("*" * 100)
+    return status_position
+
+
+class ComparisonResult:
+    """
+    Result of comparing two reports, returned by validate_vm_report: overall status, counts of passed and failed
+    checks, the status and deviation counts of every section, and the deviations themselves, indexed by section,
+    column, record key and deviation type. It is truthy when no deviations were found.
+    Section results are added as the sections are compared and passed on to an optional SummaryWriter, so that
+    the Summary file is written from the same messages.
+    Deviations are kept in memory unless keep_deviations is False; they can also be written to a DeviationStore
+    file as they are found, which answers the deviation queries when they are not kept. Deviations neither kept
+    nor written to a given file are written to a temporary one, removed with the ComparisonResult.
+    """
+    index_fields = ['section', 'column', 'key', 'deviation_type']
+
+    def __init__(self, expected=None, actual=None, summary=None, summary_writer=None, keep_deviations=True,
+                 deviation_store=None):
+        self.expected = expected
+        self.actual = actual
+        self.summary = summary
+        self.summary_writer = summary_writer
+        self.error = None
+        self.passed_checks = 0
+        self.failed_checks = 0
+        self.section_status = OrderedDict()
+        self.section_counts = OrderedDict()
+        # True if both reports have the same digest, see is_report_data_identical
+        self.identical_data = False
+        # Section header string -> DuplicateKeyCount, for sections with records sharing a key
+        self.duplicate_counts = OrderedDict()
+        self.keep_deviations = keep_deviations
+        self.deviation_count = 0
+        self.deviations = []
+        self._indexes = {field: {} for field in self.index_fields}
+        if not keep_deviations and deviation_store is None:
+            fd, deviation_store = tempfile.mkstemp(prefix='csvcompare_', suffix='.sqlite')
+            os.close(fd)
+            weakref.finalize(self, os.remove, deviation_store)
+        # Path of the DeviationStore file deviations are written to as they are found
+        self.deviation_store = deviation_store
+        self._deviation_store_writer = None if deviation_store is None else DeviationStoreWriter(deviation_store)
+        # StageRecord list of the comparison, when it was profiled
+        self.stage_records = []
+
+    @property
+    def status(self):
+        return self.failed_checks == 0
+
+    def __bool__(self):
+        return self.status
+
+    def __repr__(self):
+        return f"ComparisonResult(status={self.status}, sections={len(self.section_status)}, " \
+               f"deviations={self.deviation_count})"
+
+    def add_flags(self, flag_list):
+        passed_checks, failed_checks = count_flags(flag_list)
+        self.passed_checks += passed_checks
+        self.failed_checks += failed_checks
+        return failed_checks == 0
+
+    def add_messages(self, summary_messages, section=None):
+        for deviation in _iter_deviations(summary_messages):
+            if isinstance(deviation, DuplicateKeyCount):
+                self.duplicate_counts[deviation.section] = deviation
+                continue
+            if deviation.section is None and section is not None:
+                deviation = deviation._replace(section=section)
+            self.deviation_count += 1
+            if self._deviation_store_writer is not None:
+                self._deviation_store_writer.add(deviation)
+            if self.keep_deviations:
+                deviation_no = len(self.deviations)
+                self.deviations.append(deviation)
+                for field, index in self._indexes.items():
+                    value = getattr(deviation, field)
+                    if value is not None:
+                        index.setdefault(value, []).append(deviation_no)
+            if deviation.section is not None:
+                self.section_counts.setdefault(deviation.section, Counter())[deviation.deviation_type] += 1
+        if self.summary_writer is not None:
+            self.summary_writer.write_messages(summary_messages, section)
+
+    def add_section(self, section_title, section_flags, section_messages):
+        self.section_status[section_title] = self.add_flags(section_flags)
+        self.section_counts.setdefault(section_title, Counter())
+        self.add_messages(section_messages, section_title)
+
+    def add_error(self, error):
+        self.error = error
+        self.add_flags([False])
+
+    def close_deviation_store(self):
+        """
+        This method indexes the DeviationStore file the deviations were written to, once the comparison is done.
+        """
+        if self._deviation_store_writer is not None:
+            self._deviation_store_writer.close(self.status)
+            self._deviation_store_writer = None
+
+    def _open_deviation_store(self):
+        if self._deviation_store_writer is not None:
+            raise ValueError("Deviations were not kept, and the deviation store is not closed yet")
+        return DeviationStore(self.deviation_store)
+
+    def iter_deviations(self):
+        """
+        This method iterates all deviations in Summary file order, from the DeviationStore file when they were not
+        kept in memory.
+        """
+        if self.keep_deviations:
+            yield from self.deviations
+        else:
+            with self._open_deviation_store() as deviation_store:
+                yield from deviation_store.iter_deviations()
+
+    def get_deviations(self, section=None, column=None, key=None, deviation_type=None):
+        """
+        This method returns the deviations matching all the given criteria, in Summary file order.
+        :param key: Record key, either as compared or as a list of key column values
+        :return: List of Deviation
+        """
+        if not self.keep_deviations:
+            with self._open_deviation_store() as deviation_store:
+                return deviation_store.get_deviations(section, column, key, deviation_type)
+        if isinstance(key, (list, tuple)):
+            key = '\x00'.join(key)
+        criteria = [(field, value) for field, value in zip(self.index_fields, [section, column, key, deviation_type])
+                    if value is not None]
+        if not criteria:
+            return list(self.deviations)
+        matches = min((self._indexes[field].get(value, []) for field, value in criteria), key=len)
+        return [self.deviations[deviation_no] for deviation_no in matches
+                if all(getattr(self.deviations[deviation_no], field) == value for field, value in criteria)]
+
+    def count_deviations(self, section=None, column=None, key=None, deviation_type=None):
+        if not self.keep_deviations:
+            with self._open_deviation_store() as deviation_store:
+                return deviation_store.count_deviations(section, column, key, deviation_type)
+        if isinstance(key, (list, tuple)):
+            key = '\x00'.join(key)
+        criteria = [value for value in [section, column, key, deviation_type] if value is not None]
+        if len(criteria) == 1:
+            field = self.index_fields[[section, column, key, deviation_type].index(criteria[0])]
+            return len(self._indexes[field].get(criteria[0], []))
+        return len(self.get_deviations(section, column, key, deviation_type))
+
+    def is_deviation_present_for_data(self, search_this):
+        """
+        This method is the counterpart of is_deviation_present_for_data for a column name, without reading the
+        Summary file.
+        :param search_this: Column name to be searched
+        :return: False and the message of the first deviation of the column, if the column has a deviation or
+                 report files or column headers deviate, else True and 'Not Found'
+        """
+        if not self.keep_deviations:
+            with self._open_deviation_store() as deviation_store:
+                return deviation_store.is_deviation_present_for_data(search_this)
+        for deviation_type in ['Column_Header_Deviation', 'Report_files_not_present']:
+            if deviation_type in self._indexes['deviation_type']:
+                return False, f"Either Column_Header_Deviation , or Report_files_not_present present in Summary\n" \
+                              f"Won't check existance of {search_this} in Summary"
+        deviation_nos = self._indexes['column'].get(search_this)
+        if deviation_nos:
+            return False, self.deviations[deviation_nos[0]].message
+        return True, 'Not Found'
+
+    def to_dict(self):
+        """
+        This method returns the overall status, check counts and the status and deviation counts of every section,
+        for JSON output.
+        """
+        return OrderedDict([('status', self.status), ('error', self.error), ('passed_checks', self.passed_checks),
+                            ('failed_checks', self.failed_checks), ('deviations', self.deviation_count),
+                            ('identical_data', self.identical_data),
+                            ('sections', OrderedDict((section_title, OrderedDict([
+                                ('status', self.section_status.get(section_title)),
+                                ('deviations', dict(self.section_counts.get(section_title, {})))]))
+                                for section_title in self.section_status)),
+                            ('duplicate_counts', OrderedDict((section_title, duplicate_count._asdict())
+                                                             for section_title, duplicate_count
+                                                             in self.duplicate_counts.items()))])
+
+    def to_columns(self):
+        """
+        This method returns the deviations column-wise, for loading into a data frame or a columnar file.
+        :return: OrderedDict of Deviation field -> list of values, one per deviation
+        """
+        deviations = list(self.iter_deviations())
+        return OrderedDict((field, [_get_json_value(value) for value in values])
+                           for field, values in zip(Deviation._fields, zip(*deviations) if deviations
+                                                    else [[] for _ in Deviation._fields]))
+
+    def write_json_lines(self, fileName):
+        """
+        This method writes the deviations to a JSON Lines file, one JSON object per deviation.
+        """
+        write_deviations_json_lines(self.iter_deviations(), fileName)
+
+    def write_deviation_store(self, fileName):
+        """
+        This method writes the deviations and the overall status to a DeviationStore sqlite file.
+        """
+        if self.deviation_store is not None and os.path.abspath(fileName) == os.path.abspath(self.deviation_store):
+            self.close_deviation_store()
+            return
+        write_deviation_store(self.iter_deviations(), fileName, self.status)
+
+
+def write_deviations_json_lines(deviations, fileName):
+    with open(fileName, mode='w', encoding='utf-8') as json_file:
+        for deviation in deviations:
+            json_file.write(json.dumps(OrderedDict((field, _get_json_value(value)) for field, value
+                                                   in zip(Deviation._fields, deviation))))
+            json_file.write('\n')
+
+
+def write_deviation_store(deviations, fileName, status=None):
+    """
+    This method writes deviations to a new DeviationStore sqlite file, replacing an existing file.
+    :param deviations: Iterable of Deviation, in Summary file order
+    :param status: Overall status of the comparison, if known
+    """
+    deviation_store_writer = DeviationStoreWriter(fileName)
+    try:
+        for deviation in deviations:
+            deviation_store_writer.add(deviation)
+    finally:
+        deviation_store_writer.close(status)
+
+
+class DeviationStoreWriter:
+    """
+    Writes deviations to a new DeviationStore sqlite file as they are found, a batch at a time, so that they need
+    not be kept in memory until the comparison ends. Indexes are built on close, once all deviations are inserted,
+    which is faster than maintaining them row by row.
+    """
+
+    def __init__(self, fileName):
+        import sqlite3
+        if os.path.exists(fileName):
+            os.remove(fileName)
+        self.fileName = fileName
+        self.deviation_count = 0
+        self.rows = []
+        self.connection = sqlite3.connect(fileName)
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        fields = ', '.join(f"{_quote_field(field)} {'INTEGER' if field.endswith('_line_no') else 'TEXT'}"
+                           for field in Deviation._fields)
+        self.connection.execute(f"CREATE TABLE deviations (deviation_no INTEGER PRIMARY KEY, {fields})")
+        self.connection.execute("CREATE TABLE comparison (name TEXT PRIMARY KEY, value TEXT)")
+        self.insert = f"INSERT INTO deviations VALUES (?, {', '.join('?' * len(Deviation._fields))})"
+
+    def add(self, deviation):
+        # expected and actual are stored as JSON, as they may be records, lists or numbers
+        self.rows.append((self.deviation_count, *deviation[:4], _dump_json_value(deviation.expected),
+                          _dump_json_value(deviation.actual), *deviation[6:]))
+        self.deviation_count += 1
+        if len(self.rows) >= deviation_store_batch_size:
+            self._flush()
+
+    def _flush(self):
+        self.connection.executemany(self.insert, self.rows)
+        self.rows = []
+
+    def close(self, status=None):
+        """
+        This method indexes the deviations, stores the overall status and closes the file.
+        :param status: Overall status of the comparison, if known
+        """
+        if self.connection is None:
+            return
+        try:
+            self._flush()
+            for field in DeviationStore.index_fields:
+                self.connection.execute(f"CREATE INDEX deviations_{field} ON deviations ({_quote_field(field)})")
+            self.connection.execute("INSERT INTO comparison VALUES ('status', ?)", (json.dumps(status),))
+            self.connection.commit()
+        finally:
+            self.connection.close()
+            self.connection = None
+
+
+def _quote_field(field):
+    # column and key are sqlite keywords
+    return f'"{field}"'
+
+
+def _dump_json_value(value):
+    if value is None:
+        return None
+    if type(value) is str and '\x00' not in value:
+        # What json.dumps returns for a string, without its type dispatch
+        return json.encoder.encode_basestring_ascii(value)
+    return json.dumps(_get_json_value(value))
+
+
+class DeviationStore:
+    """
+    Deviations of a comparison in a sqlite file written by write_deviation_store, indexed by section, column,
+    record key and deviation type like ComparisonResult, so that the deviations of a large comparison are counted,
+    looked up and paged through without reading the Summary file. Deviations read back have expected and actual
+    as decoded from JSON.
+    """
+    index_fields = ComparisonResult.index_fields
+
+    def __init__(self, fileName):
+        import sqlite3
+        if not os.path.isfile(fileName):
+            raise FileNotFoundError(fileName)
+        self.fileName = fileName
+        self.connection = sqlite3.connect(f"file:{os.path.abspath(fileName)}?mode=ro", uri=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    @property
+    def status(self):
+        """
+        Overall status of the comparison, None if it was not stored.
+        """
+        result = self.connection.execute("SELECT value FROM comparison WHERE name = 'status'").fetchone()
+        return None if result is None else json.loads(result[0])
+
+    def get_deviations(self, section=None, column=None, key=None, deviation_type=None, limit=None, offset=0):
+        """
+        This method returns the deviations matching all the given criteria, in Summary file order.
+        :param key: Record key, either as compared or as a list of key column values
+        :param limit: If given, number of deviations returned, from offset on
+        :param offset: Number of matching deviations skipped
+        :return: List of Deviation
+        """
+        return list(self.iter_deviations(section, column, key, deviation_type, limit, offset))
+
+    def iter_deviations(self, section=None, column=None, key=None, deviation_type=None, limit=None, offset=0):
+        """
+        This method is get_deviations reading the deviations a batch at a time.
+        :return: Generator of Deviation
+        """
+        where, parameters = self._get_criteria(section, column, key, deviation_type)
+        query = f"SELECT {', '.join(map(_quote_field, Deviation._fields))} FROM deviations{where} " \
+                f"ORDER BY deviation_no LIMIT ? OFFSET ?"
+        cursor = self.connection.execute(query, parameters + [-1 if limit is None else limit, offset])
+        while True:
+            results = cursor.fetchmany(deviation_store_batch_size)
+            if not results:
+                break
+            for result in results:
+                yield Deviation(*result[:4], _load_json_value(result[4]), _load_json_value(result[5]), *result[6:])
+
+    def get_page(self, page_no, page_size=100, section=None, column=None, key=None, deviation_type=None):
+        """
+        This method returns one page of the deviations matching all the given criteria.
+        :param page_no: Number of the page, starting at 1
+        :return: List of Deviation
+        """
+        return self.get_deviations(section, column, key, deviation_type, page_size, (page_no - 1) * page_size)
+
+    def count_deviations(self, section=None, column=None, key=None, deviation_type=None):
+        where, parameters = self._get_criteria(section, column, key, deviation_type)
+        return self.connection.execute(f"SELECT COUNT(*) FROM deviations{where}", parameters).fetchone()[0]
+
+    def count_by(self, field, section=None, column=None, key=None, deviation_type=None):
+        """
+        This method counts the deviations matching all the given criteria per value of field, e.g. per column.
+        :param field: One of index_fields
+        :return: OrderedDict of field value -> number of deviations, most deviations first; deviations without a
+                 value of field are not counted
+        """
+        if field not in self.index_fields:
+            raise ValueError(f"field must be one of {self.index_fields}, not [{field}]")
+        where, parameters = self._get_criteria(section, column, key, deviation_type)
+        where += f"{' AND' if where else ' WHERE'} {_quote_field(field)} IS NOT NULL"
+        return OrderedDict(self.connection.execute(
+            f"SELECT {_quote_field(field)}, COUNT(*) FROM deviations{where} GROUP BY {_quote_field(field)} "
+            f"ORDER BY COUNT(*) DESC, {_quote_field(field)}", parameters))
+
+    def is_deviation_present_for_data(self, search_this):
+        """
+        This method is the counterpart of is_deviation_present_for_data for a column name, by index lookups.
+        :param search_this: Column name to be searched
+        :return: False and the message of the first deviation of the column, if the column has a deviation or
+                 report files or column headers deviate, else True and 'Not Found'
+        """
+        for deviation_type in ['Column_Header_Deviation', 'Report_files_not_present']:
+            if self.count_deviations(deviation_type=deviation_type):
+                return False, f"Either Column_Header_Deviation , or Report_files_not_present present in Summary\n" \
+                              f"Won't check existance of {search_this} in Summary"
+        deviations = self.get_deviations(column=search_this, limit=1)
+        if deviations:
+            return False, deviations[0].message
+        return True, 'Not Found'
+
+    def _get_criteria(self, section, column, key, deviation_type):
+        if isinstance(key, (list, tuple)):
+            key = '\x00'.join(key)
+        criteria = [(field, value) for field, value in zip(self.index_fields, [section, column, key, deviation_type])
+                    if value is not None]
+        if not criteria:
+            return '', []
+        return f" WHERE {' AND '.join(f'{_quote_field(field)} = ?' for field, value in criteria)}", \
+            [value for field, value in criteria]
+
+
+def _load_json_value(value):
+    return None if value is None else json.loads(value)
+
+
+def is_deviation_store(fileName):
+    """
+    This method returns True, if fileName is a sqlite file, e.g. written by write_deviation_store.
+    """
+    with open(fileName, "rb") as store_file:
+        return store_file.read(16) == b'SQLite format 3\x00'
+
+
+def _iter_deviations(summary_messages):
+    messages = [iter(summary_messages)]
+    while messages:
+        for message in messages[-1]:
+            if isinstance(message, (Deviation, DuplicateKeyCount)):
+                yield message
+            elif isinstance(message, DeviationMessage):
+                yield from message.deviations
+            elif isinstance(message, list):
+                messages.append(iter(message))
+                break
+        else:
+            messages.pop()
+
+
+def _get_json_value(value):
+    if isinstance(value, Mapping):
+        return OrderedDict(value.items())
+    if isinstance(value, str) and '\x00' in value:
+        return value.split('\x00')
+    return value
+
+
+def _open_summary(summary):
+    with open(summary, "rb") as summary_file:
+        compressed = summary_file.read(2) == b'\x1f\x8b'
+    return gzip.open(summary, "rt") if compressed else open(summary, "r")
 
 
 def assert_comparison(summary):
     global success_msg, failure_msg
-    with open(summary, 'r') as read_obj:
+    with _open_summary(summary) as read_obj:
         for line in read_obj:
             if success_msg in line:
                 return True
@@ -514,7 +3147,7 @@ def assert_comparison(summary):
 def is_deviation_present_for_data(validation_summary, search_this):
     """
     This method returns True, if given column name is marked as a deviation in Report Comparison summary file
-    :param validation_summary: Path of Summary file
+    :param validation_summary: Path of Summary file, or of a DeviationStore file, which is searched by index
     :param search_this: Column name to be searched
     :return: True, if column name found, else False
     """
@@ -522,11 +3155,14 @@ def is_deviation_present_for_data(validation_summary, search_this):
     report_absent_str = 'Report_files_not_present'
 
     print(f"Checking deviation for column {search_this} in {validation_summary}")
+    if os.path.isfile(validation_summary) and is_deviation_store(validation_summary):
+        with DeviationStore(validation_summary) as deviation_store:
+            return deviation_store.is_deviation_present_for_data(search_this)
     if os.path.getsize(validation_summary) == 0:
         print('Summary file is empty')
         return False, 'Summary file is empty'
     if os.path.isfile(validation_summary):
-        with open(validation_summary, "r") as f:
+        with _open_summary(validation_summary) as f:
             data = f.readlines()
         f.close()
         _validation_flag = True
@@ -547,30 +3183,650 @@ def is_deviation_present_for_data(validation_summary, search_this):
     return _validation_flag, _summary_line
 
 
-def validate_vmcsv_report(expected, actual, summary):
-    if os.path.exists(expected) and os.path.exists(actual):
-        expected_dict = read_report_sections_in_dict(expected)
-        actual_dict = read_report_sections_in_dict(actual)
-        # compare_dict(expected_dict, actual_dict, "expected_map", "actual_map")
-        flag_list, summary_messages = compare_reports(expected_dict, actual_dict)
-    else:
-        flag_list = [False]
-        summary_messages = [
-            ['[ERROR: Report_files_not_present] Expected or Actual file is not present at given location']]
-
-    write_report_comparison_summary(flag_list, summary_messages, summary)
-    return assert_comparison(summary)
-
-
-def validate_vm_report(expected_report, actual_report, validation_summary):
+def validate_vmcsv_report(expected, actual, summary, memory_budget=None, workers=1, compare_backend='python',
+                          baseline_cache_dir=None, section_keys_file=None, compress_summary=False,
+                          delta_state_dir=None, profile=False, profile_file=None, column_specs_file=None,
+                          keep_deviations=None, deviation_store=None):
+    default_section_key_specs = section_key_specs
+    default_column_specs = column_specs
+    default_stage_profiler = stage_profiler
+    if section_keys_file is not None:
+        # Specs from the file take precedence over the built-in ones, for this comparison only
+        _set_section_key_specs(load_section_key_specs(section_keys_file) + section_key_specs)
+    if column_specs_file is not None:
+        _set_column_specs(load_column_specs(column_specs_file) + column_specs)
+    if profile or profile_file is not None:
+        _set_stage_profiler(StageProfiler())
+    profiler = None
+    trace_memory = False
+    if profile_file is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+        trace_memory = not tracemalloc.is_tracing()
+        if trace_memory:
+            tracemalloc.start()
+        profiler.enable()
     try:
-        return validate_vmcsv_report(expected_report, actual_report, validation_summary)
+        return _validate_vmcsv_report(expected, actual, summary, memory_budget, workers, compare_backend,
+                                      baseline_cache_dir, compress_summary, delta_state_dir, keep_deviations,
+                                      deviation_store)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_file)
+            tracemalloc.take_snapshot().dump(f"{profile_file}.tracemalloc")
+            if trace_memory:
+                tracemalloc.stop()
+        _set_section_key_specs(default_section_key_specs)
+        _set_column_specs(default_column_specs)
+        _set_stage_profiler(default_stage_profiler)
+
+
+def _validate_vmcsv_report(expected, actual, summary, memory_budget, workers, compare_backend, baseline_cache_dir,
+                           compress_summary, delta_state_dir, keep_deviations=None, deviation_store=None):
+    if compare_backend not in compare_backends:
+        raise ValueError(f"compare_backend must be one of {compare_backends}, not [{compare_backend}]")
+    if compare_backend == 'numpy' and _load_numpy() is None:
+        print("NumPy is not installed, comparing report data with the python backend")
+        compare_backend = 'python'
+    options = ComparisonOptions(compare_backend)
+    if keep_deviations is None:
+        keep_deviations = memory_budget is None
+    with SummaryWriter(summary, compress_summary) as summary_writer:
+        # Deviations of the records are taken from the delta state, which is written from the kept deviations
+        comparison_result = ComparisonResult(expected, actual, summary, summary_writer,
+                                             keep_deviations or delta_state_dir is not None, deviation_store)
+        try:
+            if memory_budget is not None and os.path.exists(expected) and os.path.exists(actual):
+                compare_reports_streaming(expected, actual, comparison_result, memory_budget, workers, options)
+            elif os.path.exists(expected) and os.path.exists(actual):
+                if baseline_cache_dir is not None:
+                    expected_dict = read_baseline_report_sections(expected, baseline_cache_dir)
+                    actual_dict = read_reports_in_parallel([actual], workers)[0] if workers > 1 \
+                        else read_report_sections_in_dict(actual)
+                elif workers > 1:
+                    expected_dict, actual_dict = read_reports_in_parallel([expected, actual], workers)
+                else:
+                    expected_dict, actual_dict = read_report_pair_sections(expected, actual)
+                # compare_dict(expected_dict, actual_dict, "expected_map", "actual_map")
+                reused_records = None
+                if delta_state_dir is not None:
+                    expected_content_hash = _get_file_content_hash(expected)
+                    actual_dict = key_report_sections(actual_dict)
+                    reused_records, row_digests = get_reused_records(
+                        actual_dict, read_delta_state(expected, actual, delta_state_dir, expected_content_hash))
+                compare_reports(expected_dict, actual_dict, workers, options, comparison_result, reused_records)
+                if delta_state_dir is not None:
+                    write_delta_state(expected, actual, delta_state_dir, expected_content_hash, actual_dict,
+                                      row_digests, comparison_result)
+            else:
+                comparison_result.add_flags([False])
+                comparison_result.add_messages([[Deviation(
+                    'Report_files_not_present',
+                    message='[ERROR: Report_files_not_present] Expected or Actual file is not present at given location')]])
+            if stage_profiler is not None:
+                comparison_result.stage_records = list(stage_profiler.stage_records)
+                summary_writer.write_messages(get_stage_profile_messages(comparison_result.stage_records))
+            summary_writer.add_flags([comparison_result.status])
+        finally:
+            comparison_result.close_deviation_store()
+    comparison_result.summary_writer = None
+    return comparison_result
+
+
+def validate_vm_report(expected_report, actual_report, validation_summary, memory_budget=None, workers=1,
+                       compare_backend='python', baseline_cache_dir=None, section_keys_file=None,
+                       compress_summary=False, delta_state_dir=None, profile=False, profile_file=None,
+                       column_specs_file=None, keep_deviations=None, deviation_store=None):
+    """
+    This method compares Expected and Actual reports and writes the Report Comparison summary.
+    :param expected_report: Expected CSV report
+    :param actual_report: Actual CSV report
+    :param validation_summary: Path of Summary file
+    :param memory_budget: If given, reports are compared one section at a time, keeping at most about this many
+                          bytes of records per section in memory and spilling the rest to a temporary sqlite file
+    :param workers: Number of worker processes used to compare report sections in parallel
+    :param compare_backend: 'python' compares records cell by cell, 'numpy' compares whole columns of a section at
+                            once (falls back to 'python' when NumPy is not installed)
+    :param baseline_cache_dir: If given, Expected report is read and keyed once and cached in this directory for
+                               later comparisons against the same report (not used with memory_budget)
+    :param section_keys_file: JSON file of section key specs (see load_section_key_specs) used before the built-in
+                              section_key_specs, for report layouts those do not cover
+    :param compress_summary: If True, Summary file is written gzip compressed; assert_comparison and
+                             is_deviation_present_for_data read both plain and compressed Summary files
+    :param delta_state_dir: If given, a digest index of the Actual report is kept in this directory, and records
+                            unchanged since the last comparison of the same reports (with the same Expected report)
+                            are not compared again, their deviations are taken from that comparison (not used with
+                            memory_budget)
+    :param profile: If True, wall time, rows, cells compared and memory high-water mark of every comparison stage
+                    are recorded per section, in ComparisonResult.stage_records and in a Stage profile block
+                    appended to Summary file
+    :param profile_file: If given, the comparison is also run under cProfile and tracemalloc, and their results are
+                         written to this file (pstats format) and to this file + '.tracemalloc' (tracemalloc
+                         snapshot); implies profile
+    :param column_specs_file: JSON file of column specs (see load_column_specs) used before the built-in
+                              column_specs, e.g. for numeric tolerances, date formats or columns not to compare
+    :param keep_deviations: If False, deviations are not kept in ComparisonResult, so that memory does not grow
+                            with the number of deviations, but written to deviation_store or to a temporary
+                            DeviationStore file, which answers the deviation queries of ComparisonResult; defaults
+                            to False with memory_budget, else True (always True with delta_state_dir)
+    :param deviation_store: If given, deviations are written to this DeviationStore file as they are found
+    :return: ComparisonResult, which is truthy if no deviations were found
+    """
+    try:
+        return validate_vmcsv_report(expected_report, actual_report, validation_summary, memory_budget, workers,
+                                     compare_backend, baseline_cache_dir, section_keys_file, compress_summary,
+                                     delta_state_dir, profile, profile_file, column_specs_file, keep_deviations,
+                                     deviation_store)
     except Exception as e:
         print("Exception occured while validating the reports")
         print(e)
         print(traceback.format_exc())
-        return False
+        comparison_result = ComparisonResult(expected_report, actual_report, validation_summary)
+        comparison_result.add_error(str(e))
+        return comparison_result
 
-print("*******")
-print(validate_vm_report("C:/temp/q.csv", "C:/temp/v.csv", "C:/temp/summary_new.txt"))
-print("*******")
+
+class ComparisonTimeout(BaseException):
+    """
+    Raised in a batch worker when a report pair takes longer than its timeout. It derives from BaseException so
+    that the exception handling of validate_vm_report does not turn it into an ordinary failed comparison.
+    """
+
+
+def _raise_comparison_timeout(signum, frame):
+    raise ComparisonTimeout()
+
+
+def _get_summary_file_name(summary_dir, actual, used_names):
+    name = os.path.splitext(os.path.basename(actual))[0] + '_summary.txt'
+    if name in used_names:
+        name = f"{os.path.splitext(name)[0]}_{len(used_names) + 1}.txt"
+    used_names.add(name)
+    return os.path.join(summary_dir, name)
+
+
+def read_report_pairs_manifest(manifest, summary_dir):
+    """
+    This method reads report pairs from a manifest file: either a CSV file with 'expected', 'actual' and optional
+    'summary' columns, or a JSON list of such objects or of [expected, actual(, summary)] lists.
+    Relative paths are relative to the manifest file.
+    :param manifest: Path of the manifest file
+    :param summary_dir: Directory of the Summary files of pairs without a 'summary' entry
+    :return: List of ReportPair
+    """
+    manifest_dir = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, mode='r', newline='') as manifest_file:
+        if manifest.lower().endswith('.json'):
+            entries = json.load(manifest_file)
+        else:
+            entries = list(csv.DictReader(manifest_file))
+
+    report_pairs = []
+    used_names = set()
+    for entry in entries:
+        if not isinstance(entry, dict):
+            entry = dict(zip(ReportPair._fields, entry))
+        expected = os.path.join(manifest_dir, entry['expected'])
+        actual = os.path.join(manifest_dir, entry['actual'])
+        summary = entry.get('summary')
+        if summary:
+            summary = os.path.join(manifest_dir, summary)
+        else:
+            summary = _get_summary_file_name(summary_dir, actual, used_names)
+        report_pairs.append(ReportPair(expected, actual, summary))
+    return report_pairs
+
+
+def find_report_pairs(expected_dir, actual_dir, summary_dir):
+    """
+    This method pairs CSV reports of two directories by file name.
+    :return: List of ReportPair, one per file name present in both directories, sorted by file name
+    """
+    expected_names = {name for name in os.listdir(expected_dir) if name.lower().endswith('.csv')}
+    actual_names = {name for name in os.listdir(actual_dir) if name.lower().endswith('.csv')}
+    for name in sorted(expected_names ^ actual_names):
+        print(f"Report {name} is present in only one of {expected_dir} and {actual_dir}")
+    used_names = set()
+    return [ReportPair(os.path.join(expected_dir, name), os.path.join(actual_dir, name),
+                       _get_summary_file_name(summary_dir, name, used_names))
+            for name in sorted(expected_names & actual_names)]
+
+
+def _validate_report_pair(report_pair, timeout, validate_options):
+    start_time = time.perf_counter()
+    use_alarm = timeout is not None and hasattr(signal, 'setitimer')
+    if use_alarm:
+        previous_handler = signal.signal(signal.SIGALRM, _raise_comparison_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        status = 'PASS' if validate_vm_report(*report_pair, **validate_options) else 'FAIL'
+    except ComparisonTimeout:
+        status = 'TIMEOUT'
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+    return BatchResult(*report_pair, status, time.perf_counter() - start_time)
+
+
+def validate_vm_report_batch(report_pairs, index_file, workers=1, timeout=None, **validate_options):
+    """
+    This method compares many report pairs in one process pool, writing a Summary file per pair and an index CSV
+    file with the status of every pair: PASS, FAIL, TIMEOUT or ERROR.
+    :param report_pairs: List of ReportPair, e.g. from read_report_pairs_manifest or find_report_pairs
+    :param index_file: Path of the index CSV file
+    :param workers: Number of worker processes, each comparing one pair at a time
+    :param timeout: Seconds a pair may take before it is reported as TIMEOUT (not enforced on platforms without
+                    SIGALRM, where pairs always run to completion)
+    :param validate_options: Further keyword arguments of validate_vm_report, e.g. baseline_cache_dir
+    :return: True, if all pairs passed, else False
+    """
+    start_time = time.perf_counter()
+    for summary_dir in {os.path.dirname(report_pair.summary) for report_pair in report_pairs}:
+        if summary_dir:
+            os.makedirs(summary_dir, exist_ok=True)
+
+    results = []
+    with _create_process_pool(max(workers, 1)) as executor:
+        futures = [executor.submit(_validate_report_pair, report_pair, timeout, validate_options)
+                   for report_pair in report_pairs]
+        for report_pair, future in zip(report_pairs, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"Exception occured while validating {report_pair.expected} and {report_pair.actual}")
+                print(e)
+                results.append(BatchResult(*report_pair, 'ERROR', None))
+
+    elapsed = time.perf_counter() - start_time
+    with open(index_file, mode='w', newline='') as index:
+        index_writer = csv.writer(index)
+        index_writer.writerow(['Expected', 'Actual', 'Summary', 'Status', 'Seconds'])
+        for result in results:
+            index_writer.writerow(result[:4] + ('' if result.seconds is None else f"{result.seconds:.3f}",))
+
+    status_counts = OrderedDict((status, 0) for status in ['PASS', 'FAIL', 'TIMEOUT', 'ERROR'])
+    for result in results:
+        status_counts[result.status] += 1
+    print(" | ".join(f"{status}: {count}" for status, count in status_counts.items()))
+    print(f"Compared {len(results)} report pairs in {elapsed:.2f} s "
+          f"({len(results) / elapsed if elapsed > 0 else 0:.2f} pairs/sec)")
+    return status_counts['PASS'] == len(results)
+
+
+class QuickCheckResult(namedtuple('QuickCheckResult', ['status', 'deviations', 'stopped_early', 'section_samples',
+                                                       'seconds'])):
+    """
+    Result of quick_check_vm_report. It is truthy when no deviations were found, like assert_comparison of a
+    Summary file. stopped_early is True if there were more than max_deviations deviations; section_samples are
+    empty unless records were sampled.
+    """
+    __slots__ = ()
+
+    def __bool__(self):
+        return self.status
+
+    def __repr__(self):
+        return f"QuickCheckResult(status={self.status}, deviations={len(self.deviations)}, " \
+               f"stopped_early={self.stopped_early}, confidence={self.confidence:.4f})"
+
+    @property
+    def confidence(self):
+        """
+        Lowest confidence of the section samples, 1.0 if all records were compared.
+        """
+        return min((section_sample.confidence for section_sample in self.section_samples), default=1.0)
+
+    def to_dict(self):
+        return OrderedDict([('status', self.status), ('deviations', len(self.deviations)),
+                            ('stopped_early', self.stopped_early), ('confidence', self.confidence),
+                            ('seconds', self.seconds),
+                            ('section_samples', [section_sample._asdict() for section_sample in self.section_samples]),
+                            ('messages', [deviation.message for deviation in self.deviations])])
+
+
+def quick_check_vm_report(expected_report, actual_report, validation_summary=None, max_deviations=1,
+                          sample_size=None, sample_seed=0, detect_rate=0.01, section_keys_file=None,
+                          column_specs_file=None):
+    """
+    This method checks whether Expected and Actual reports deviate, without collecting every deviation: it stops
+    at the first max_deviations deviations found. Report sections, column headers and record counts are checked
+    before any record is read, so that broken reports fail fast.
+    :param expected_report: Expected CSV report
+    :param actual_report: Actual CSV report
+    :param validation_summary: If given, path of a Summary file written with the deviations found, for
+                               assert_comparison
+    :param max_deviations: Number of deviations after which the check stops
+    :param sample_size: If given, at most this many record keys of each section are compared, chosen by a hash of
+                        the key seeded with sample_seed, so that every run compares the same records
+    :param sample_seed: Seed of the record sample
+    :param detect_rate: Fraction of deviating records the confidence of a section sample is given for
+    :return: QuickCheckResult
+    """
+    if max_deviations < 1:
+        raise ValueError(f"max_deviations must be at least 1, not [{max_deviations}]")
+    if sample_size is not None and sample_size < 1:
+        raise ValueError(f"sample_size must be at least 1, not [{sample_size}]")
+    default_section_key_specs = section_key_specs
+    default_column_specs = column_specs
+    if section_keys_file is not None:
+        _set_section_key_specs(load_section_key_specs(section_keys_file) + section_key_specs)
+    if column_specs_file is not None:
+        _set_column_specs(load_column_specs(column_specs_file) + column_specs)
+    start_time = time.perf_counter()
+    section_samples = []
+    stopped_early = False
+    try:
+        if os.path.exists(expected_report) and os.path.exists(actual_report):
+            # One deviation more than max_deviations is looked for, to know whether the check stopped early
+            deviations = list(itertools.islice(iter_quick_check_deviations(expected_report, actual_report,
+                                                                           sample_size, sample_seed, detect_rate,
+                                                                           section_samples), max_deviations + 1))
+            stopped_early = len(deviations) > max_deviations
+            del deviations[max_deviations:]
+        else:
+            deviations = [Deviation('Report_files_not_present',
+                                    message='[ERROR: Report_files_not_present] Expected or Actual file is not '
+                                            'present at given location')]
+    finally:
+        _set_section_key_specs(default_section_key_specs)
+        _set_column_specs(default_column_specs)
+    quick_check_result = QuickCheckResult(not deviations, deviations, stopped_early,
+                                          section_samples, time.perf_counter() - start_time)
+    if validation_summary is not None:
+        msg = [f"Quick check of report data, stopping at {max_deviations} deviations:"]
+        msg += deviations
+        msg += [f"Sampled {section_sample.sampled_records} of {section_sample.records} records | Section Title: "
+                f"[ {section_sample.section} ] | Confidence: {section_sample.confidence:.4f}"
+                for section_sample in section_samples]
+        with SummaryWriter(validation_summary) as summary_writer:
+            summary_writer.write_messages([msg])
+            summary_writer.add_flags([quick_check_result.status])
+    return quick_check_result
+
+
+def iter_quick_check_deviations(expected, actual, sample_size=None, sample_seed=0, detect_rate=0.01,
+                                section_samples=None):
+    """
+    This method finds the deviations of two reports lazily, cheapest checks first: report sections, then per
+    section its column header and record count, its records and its sort order. Sections are read one at a time
+    and only when the deviations before them have been consumed.
+    :param sample_size: If given, at most this many record keys of each section are compared, see
+                        get_sampled_record_keys
+    :param section_samples: Optional list a SectionSample is appended to for every sampled section
+    :return: Generator of Deviation
+    """
+    map_1 = index_report_sections(expected)
+    map_2 = match_report_sections(map_1, index_report_sections(actual))
+    section_comparison_flag, section_messages = compare_report_sections(map_1, map_2)
+    yield from _iter_deviations(section_messages)
+    for header_str_key, map_1_section_index in map_1.items():
+        map_2_section_index = map_2.get(header_str_key)
+        if map_2_section_index is None or is_section_data_identical(map_1_section_index, map_2_section_index):
+            continue
+        for deviation in itertools.chain(
+                _iter_deviations(compare_report_header(map_1_section_index.header, map_2_section_index.header)[1]),
+                _iter_quick_check_section_deviations(expected, actual, map_1_section_index, map_2_section_index,
+                                                     header_str_key, sample_size, sample_seed, detect_rate,
+                                                     section_samples)):
+            yield deviation if deviation.section is not None else deviation._replace(section=header_str_key)
+
+
+def _iter_quick_check_section_deviations(expected, actual, exp_section_index, act_section_index, section_title,
+                                         sample_size, sample_seed, detect_rate, section_samples):
+    if exp_section_index.record_count != act_section_index.record_count:
+        msg = f"Record_Count_Deviation | Section Title: [ {section_title} ] | Expected Record count: [{exp_section_index.record_count}] | Actual Record count: [{act_section_index.record_count}]"
+        yield Deviation('Record_Count_Deviation', section_title, expected=exp_section_index.record_count,
+                        actual=act_section_index.record_count, message=msg)
+    lst_exp, odict_exp, index_exp = key_section_records(iter_section_records(expected, exp_section_index),
+                                                        exp_section_index.header)
+    lst_act, odict_act, index_act = key_section_records(iter_section_records(actual, act_section_index),
+                                                        act_section_index.header)
+    duplicate_keys = get_duplicate_key_index(odict_exp).keys() | get_duplicate_key_index(odict_act).keys()
+    record_keys = OrderedDict.fromkeys(get_record_key(key) for key in itertools.chain(odict_exp, odict_act))
+    if sample_size is not None:
+        sampled_record_keys = get_sampled_record_keys(record_keys, sample_size, sample_seed)
+        if section_samples is not None and record_keys:
+            section_samples.append(SectionSample(section_title, len(record_keys), len(sampled_record_keys),
+                                                 get_sample_confidence(len(record_keys), len(sampled_record_keys),
+                                                                       detect_rate)))
+        record_keys = [record_key for record_key in record_keys if record_key in sampled_record_keys]
+    for record_key in record_keys:
+        if record_key in duplicate_keys:
+            exp_absent, act_absent, compared_records = compare_duplicate_records([record_key], odict_exp, odict_act,
+                                                                                 index_exp, index_act)
+            for position, deviation in itertools.chain(exp_absent, act_absent):
+                yield deviation
+            for position, data_mismatch_flag, data_error_message in compared_records:
+                yield from data_error_message
+        elif record_key not in odict_act:
+            yield _get_absent_record_deviation(record_key, odict_exp[record_key], index_exp[record_key].line_no,
+                                               'Actual')
+        elif record_key not in odict_exp:
+            yield _get_absent_record_deviation(record_key, odict_act[record_key], index_act[record_key].line_no,
+                                               'Expected')
+        else:
+            yield from compare_report_data_dicts(odict_exp[record_key], odict_act[record_key],
+                                                 index_exp[record_key].line_no, index_act[record_key].line_no,
+                                                 record_key)[1]
+    yield from _iter_deviations(check_sort_order(odict_exp, odict_act, index_exp, index_act)[1])
+
+
+def get_sampled_record_keys(record_keys, sample_size, sample_seed=0):
+    """
+    This method draws a deterministic sample of record keys: the sample_size keys of the smallest hash seeded with
+    sample_seed. As the hash depends on the key only, a record sampled in one report is sampled in the other
+    one as well.
+    :return: Set of sampled record keys
+    """
+    if len(record_keys) <= sample_size:
+        return set(record_keys)
+    seed = str(sample_seed).encode('utf-8')
+    return {record_key for key_hash, record_key in nsmallest(
+        sample_size, ((hashlib.blake2b(record_key.encode('utf-8', 'surrogatepass'), digest_size=8, key=seed).digest(),
+                       record_key) for record_key in record_keys))}
+
+
+def get_sample_confidence(records, sampled_records, detect_rate):
+    """
+    This method returns the probability that sampled_records drawn from records without replacement include a
+    deviating record, if detect_rate of the records (at least one) deviate.
+    """
+    other_records = records - max(1, math.ceil(detect_rate * records))
+    if sampled_records > other_records:
+        return 1.0
+    # Log of the probability of drawing no deviating record: C(other_records, sampled_records) / C(records,
+    # sampled_records)
+    missed = math.lgamma(other_records + 1) - math.lgamma(other_records - sampled_records + 1) \
+        - math.lgamma(records + 1) + math.lgamma(records - sampled_records + 1)
+    return 1.0 - math.exp(missed)
+
+
+def main(argv=None):
+    """
+    This method is the command line interface of validate_vm_report, run as python -m compare_csv, of
+    DeviationStore, run as python -m compare_csv query (see query_main), and of validate_vm_report_batch, run as
+    python -m compare_csv batch (see batch_main).
+    :return: Exit status: 0 if no deviations were found, 1 if deviations were found, 2 if the comparison failed
+    """
+    import argparse
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == 'query':
+        return query_main(argv[1:])
+    if argv and argv[0] == 'batch':
+        return batch_main(argv[1:])
+    parser = argparse.ArgumentParser(prog='python -m compare_csv',
+                                     description='Compare Expected and Actual CSV reports and write the Report '
+                                                 'Comparison summary')
+    parser.add_argument('expected', help='Expected CSV report')
+    parser.add_argument('actual', help='Actual CSV report')
+    parser.add_argument('summary', help='Path of Summary file')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes')
+    parser.add_argument('--memory-budget', type=int, default=None,
+                        help='Compare one section at a time, with about this many bytes of records in memory')
+    parser.add_argument('--compare-backend', choices=compare_backends, default='python')
+    parser.add_argument('--baseline-cache-dir', default=None)
+    parser.add_argument('--section-keys-file', default=None, help='JSON file of section key specs')
+    parser.add_argument('--column-specs-file', default=None,
+                        help='JSON file of column specs: numeric tolerances, date formats, skipped columns')
+    parser.add_argument('--compress-summary', action='store_true', help='Write Summary file gzip compressed')
+    parser.add_argument('--delta-state-dir', default=None)
+    parser.add_argument('--profile', action='store_true', help='Append a stage profile to Summary file')
+    parser.add_argument('--profile-file', default=None, help='Write cProfile and tracemalloc results to this file')
+    parser.add_argument('--deviations-file', default=None, help='Write the deviations to this JSON Lines file')
+    parser.add_argument('--deviation-store', default=None,
+                        help='Write the deviations to this indexed sqlite file, see python -m compare_csv query')
+    parser.add_argument('--format', choices=['text', 'json'], default='text',
+                        help='Format of the comparison result printed on standard output')
+    parser.add_argument('--quick', type=int, nargs='?', const=1, default=None, metavar='N',
+                        help='Quick check: stop at the first N deviations (1 if not given); options of the full '
+                             'comparison such as --workers or --memory-budget are not used')
+    parser.add_argument('--sample-size', type=int, default=None,
+                        help='With --quick, compare at most this many records of each section')
+    parser.add_argument('--sample-seed', type=int, default=0, help='Seed of the --sample-size record sample')
+    parser.add_argument('--detect-rate', type=float, default=0.01,
+                        help='Fraction of deviating records the confidence of a --sample-size sample is given for')
+    args = parser.parse_args(argv)
+    if args.quick is None and args.sample_size is not None:
+        parser.error('--sample-size requires --quick')
+    if args.quick is not None:
+        return _quick_check_main(args)
+
+    # Diagnostics must not be mixed into the JSON result
+    with contextlib.redirect_stdout(sys.stderr) if args.format == 'json' else contextlib.nullcontext():
+        comparison_result = validate_vm_report(args.expected, args.actual, args.summary, args.memory_budget,
+                                               args.workers, args.compare_backend, args.baseline_cache_dir,
+                                               args.section_keys_file, args.compress_summary, args.delta_state_dir,
+                                               args.profile, args.profile_file, args.column_specs_file,
+                                               deviation_store=args.deviation_store)
+    if args.deviations_file is not None:
+        comparison_result.write_json_lines(args.deviations_file)
+    if args.format == 'json':
+        print(json.dumps(comparison_result.to_dict(), indent=2))
+    else:
+        print(comparison_result)
+        for section_title, section_status in comparison_result.section_status.items():
+            print(f"{'PASS' if section_status else 'FAIL'} | {section_title}")
+    if comparison_result.error is not None:
+        return 2
+    return 0 if comparison_result else 1
+
+
+def _quick_check_main(args):
+    with contextlib.redirect_stdout(sys.stderr) if args.format == 'json' else contextlib.nullcontext():
+        quick_check_result = quick_check_vm_report(args.expected, args.actual, args.summary, args.quick,
+                                                   args.sample_size, args.sample_seed, args.detect_rate,
+                                                   args.section_keys_file, args.column_specs_file)
+    if args.deviations_file is not None:
+        write_deviations_json_lines(quick_check_result.deviations, args.deviations_file)
+    if args.deviation_store is not None:
+        write_deviation_store(quick_check_result.deviations, args.deviation_store, quick_check_result.status)
+    if args.format == 'json':
+        print(json.dumps(quick_check_result.to_dict(), indent=2))
+    else:
+        print(quick_check_result)
+        for deviation in quick_check_result.deviations:
+            print(deviation)
+    return 0 if quick_check_result else 1
+
+
+def query_main(argv=None):
+    """
+    This method is the command line interface of DeviationStore: it counts the deviations per value of a field,
+    or lists a page of them, matching all the given criteria.
+    :return: Exit status: 0 if no deviations match, 1 if deviations match
+    """
+    import argparse
+    parser = argparse.ArgumentParser(prog='python -m compare_csv query',
+                                     description='Query the deviations of a DeviationStore file')
+    parser.add_argument('store', help='DeviationStore file written with --deviation-store')
+    parser.add_argument('--section', default=None, help='Section header string')
+    parser.add_argument('--column', default=None)
+    parser.add_argument('--key', nargs='+', default=None, help='Record key, as key column values')
+    parser.add_argument('--type', dest='deviation_type', default=None,
+                        help='Deviation type, e.g. Column_Data_Deviation')
+    parser.add_argument('--count-by', choices=DeviationStore.index_fields, default=None,
+                        help='Count the deviations per value of this field instead of listing them')
+    parser.add_argument('--page', type=int, default=1, help='Page of the listed deviations, starting at 1')
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--format', choices=['text', 'json'], default='text')
+    args = parser.parse_args(argv)
+
+    criteria = [args.section, args.column, args.key, args.deviation_type]
+    with DeviationStore(args.store) as deviation_store:
+        deviation_count = deviation_store.count_deviations(*criteria)
+        if args.count_by is not None:
+            counts = deviation_store.count_by(args.count_by, *criteria)
+            if args.format == 'json':
+                print(json.dumps([OrderedDict([(args.count_by, _get_json_value(value)), ('deviations', count)])
+                                  for value, count in counts.items()], indent=2))
+            else:
+                for value, count in counts.items():
+                    # Key column values of a record key are NUL separated
+                    print(f"{count} | {value.replace(chr(0), ' | ')}")
+        else:
+            deviations = deviation_store.get_page(args.page, args.page_size, *criteria)
+            if args.format == 'json':
+                print(json.dumps(OrderedDict([
+                    ('page', args.page), ('page_size', args.page_size), ('deviations', deviation_count),
+                    ('results', [OrderedDict((field, _get_json_value(value)) for field, value
+                                             in zip(Deviation._fields, deviation)) for deviation in deviations])]),
+                    indent=2))
+            else:
+                for deviation in deviations:
+                    print(deviation)
+                print(f"Page {args.page} of {max(1, math.ceil(deviation_count / args.page_size))} | "
+                      f"Deviations: {deviation_count}")
+    return 1 if deviation_count else 0
+
+
+def batch_main(argv=None):
+    """
+    This method is the command line interface of validate_vm_report_batch: it compares the report pairs of a
+    manifest file, or the reports of the same file name in two directories.
+    :return: Exit status: 0 if all pairs passed, 1 if any pair failed, timed out or could not be compared
+    """
+    import argparse
+    parser = argparse.ArgumentParser(prog='python -m compare_csv batch',
+                                     description='Compare many Expected and Actual CSV report pairs and write a '
+                                                 'Summary file per pair and an index CSV file')
+    pairs = parser.add_mutually_exclusive_group(required=True)
+    pairs.add_argument('--manifest', default=None,
+                       help="CSV or JSON file of report pairs: 'expected', 'actual' and optional 'summary'")
+    pairs.add_argument('--expected-dir', default=None, help='Directory of Expected CSV reports, with --actual-dir')
+    parser.add_argument('--actual-dir', default=None, help='Directory of Actual CSV reports, with --expected-dir')
+    parser.add_argument('summary_dir', help='Directory of Summary files')
+    parser.add_argument('index_file', help='Path of index CSV file')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes, one pair each')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='Seconds a pair may take before it is reported as TIMEOUT')
+    parser.add_argument('--memory-budget', type=int, default=None,
+                        help='Compare one section at a time, with about this many bytes of records in memory')
+    parser.add_argument('--compare-backend', choices=compare_backends, default='python')
+    parser.add_argument('--baseline-cache-dir', default=None)
+    parser.add_argument('--section-keys-file', default=None, help='JSON file of section key specs')
+    parser.add_argument('--column-specs-file', default=None,
+                        help='JSON file of column specs: numeric tolerances, date formats, skipped columns')
+    parser.add_argument('--compress-summary', action='store_true', help='Write Summary files gzip compressed')
+    args = parser.parse_args(argv)
+    if (args.expected_dir is None) != (args.actual_dir is None):
+        parser.error('--expected-dir and --actual-dir must be given together')
+
+    if args.manifest is not None:
+        report_pairs = read_report_pairs_manifest(args.manifest, args.summary_dir)
+    else:
+        report_pairs = find_report_pairs(args.expected_dir, args.actual_dir, args.summary_dir)
+    batch_passed = validate_vm_report_batch(report_pairs, args.index_file, args.workers, args.timeout,
+                                            memory_budget=args.memory_budget,
+                                            compare_backend=args.compare_backend,
+                                            baseline_cache_dir=args.baseline_cache_dir,
+                                            section_keys_file=args.section_keys_file,
+                                            column_specs_file=args.column_specs_file,
+                                            compress_summary=args.compress_summary)
+    return 0 if batch_passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
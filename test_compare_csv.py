@@ -0,0 +1,256 @@
+import csv
+import json
+import os
+
+import compare_csv
+
+
+def write_report(path, sections):
+    """
+    Writes a report with a title block followed by sections separated by blank rows.
+    :param sections: List of (header, rows) tuples
+    """
+    with open(path, 'w', newline='') as report_file:
+        writer = csv.writer(report_file, quoting=csv.QUOTE_ALL)
+        writer.writerow(['Scan Results', '2020-01-01'])
+        writer.writerow(['Company', 'Address'])
+        writer.writerow(['ACME', 'Street 1'])
+        for header, rows in sections:
+            writer.writerow([])
+            writer.writerow(header)
+            writer.writerows(rows)
+    return str(path)
+
+
+host_header = ['IP', 'Network', 'Total Vulnerabilities', 'Security Risk']
+
+
+def compare(tmp_path, exp_sections, act_sections, **options):
+    expected = write_report(tmp_path / 'expected.csv', exp_sections)
+    actual = write_report(tmp_path / 'actual.csv', act_sections)
+    summary = str(tmp_path / 'summary.txt')
+    return compare_csv.validate_vm_report(expected, actual, summary, **options), summary
+
+
+def test_missing_and_extra_record_fail(tmp_path):
+    exp_rows = [['g1', 'Global', '1', '1.0'], ['g2', 'Global', '2', '1.0'], ['g3', 'Global', '3', '1.0']]
+    act_rows = [['g1', 'Global', '1', '1.0'], ['g2', 'Global', '2', '1.0'], ['g4', 'Global', '3', '1.0']]
+    for options in [{}, {'memory_budget': 1000},
+                    {'memory_budget': 1000, 'deviation_store': str(tmp_path / 'deviations.sqlite')}]:
+        comparison_result, summary = compare(tmp_path, [(host_header, exp_rows)], [(host_header, act_rows)],
+                                             **options)
+        assert not comparison_result
+        assert not compare_csv.assert_comparison(summary)
+        assert comparison_result.count_deviations(deviation_type='Record_Absent_Deviation') == 2
+        assert comparison_result.count_deviations(key=['g4', 'Global']) == 1
+        assert comparison_result.count_deviations(key=('g4', 'Global'),
+                                                  deviation_type='Record_Absent_Deviation') == 1
+
+
+def write_raw_report(path, lines):
+    with open(path, 'w', newline='') as report_file:
+        report_file.write('\n'.join(lines) + '\n')
+    return str(path)
+
+
+def test_quote_inside_unquoted_value_is_literal(tmp_path):
+    lines = ['Scan Results,2020-01-01', 'Company,Address', 'ACME,Street 1', '',
+             'Name,IP,Severity,Comment', 'g1,1.1.1.1,5,12" disk', 'g2,1.1.1.2,4,ok', '',
+             'Total Vulnerabilities,Average Security Risk', '{total},3.2']
+    expected = write_raw_report(tmp_path / 'expected.csv', [line.format(total=10) for line in lines])
+    actual = write_raw_report(tmp_path / 'actual.csv', [line.format(total=11) for line in lines])
+    with open(expected, newline='') as csv_file:
+        assert compare_csv._getRecordCount(expected) == sum(1 for row in csv.reader(csv_file))
+    assert len(compare_csv.index_report_sections(expected)) == 3
+    summary = str(tmp_path / 'summary.txt')
+    assert not compare_csv.validate_vm_report(expected, actual, summary)
+    assert not compare_csv.validate_vm_report(expected, actual, summary, memory_budget=1000)
+    assert not compare_csv.quick_check_vm_report(expected, actual)
+
+
+scan_details_header = ['Launch Date', 'Active Hosts', 'Total Hosts', 'Type', 'Status', 'Reference',
+                       'Scanner Appliance', 'Duration', 'Scan Title']
+
+
+def test_key_columns_are_compared_by_column_specs(tmp_path):
+    column_specs_file = tmp_path / 'column_specs.json'
+    column_specs_file.write_text(json.dumps([{'name': 'launch_date', 'match_columns': ['Launch Date'], 'columns': {
+        'Launch Date': {'type': 'date', 'format': ['%m/%d/%Y %H:%M:%S', '%Y-%m-%d %H:%M:%S']}}}]))
+    scan_details = ['5', '5', 'On demand', 'Finished', 'scan/123', 'appl', '00:10:00', 'My Scan']
+    exp_sections = [(['Total Vulnerabilities', 'Average Security Risk'], [['1024', '3.2']]),
+                    (scan_details_header, [['01/01/2020 10:00:00'] + scan_details])]
+    act_sections = [(['Total Vulnerabilities', 'Average Security Risk'], [['1,024', '3.2']]),
+                    (scan_details_header, [['2020-01-01 10:00:00'] + scan_details])]
+    comparison_result, summary = compare(tmp_path, exp_sections, act_sections,
+                                         column_specs_file=str(column_specs_file))
+    assert comparison_result.count_deviations(deviation_type='Record_Absent_Deviation') == 0
+    assert comparison_result
+
+
+def test_quick_check_has_the_status_of_the_full_comparison(tmp_path):
+    exp_rows = [['g1', 'Global', '1', '1.0'], ['g2', 'Global', '2', '1.0'], ['g3', 'Global', '3', '1.0']]
+    act_rows = [['g1', 'Global', '1', '1.0'], ['g2', 'Global', '2', '1.0'], ['g4', 'Global', '3', '1.0']]
+    comparison_result, summary = compare(tmp_path, [(host_header, exp_rows)], [(host_header, act_rows)])
+    quick_summary = str(tmp_path / 'quick_summary.txt')
+    quick_check_result = compare_csv.quick_check_vm_report(str(tmp_path / 'expected.csv'),
+                                                           str(tmp_path / 'actual.csv'), quick_summary)
+    assert bool(quick_check_result) == bool(comparison_result) == compare_csv.assert_comparison(quick_summary)
+    assert quick_check_result.stopped_early
+    # Exactly as many deviations as max_deviations
+    quick_check_result = compare_csv.quick_check_vm_report(str(tmp_path / 'expected.csv'),
+                                                           str(tmp_path / 'actual.csv'), max_deviations=2)
+    assert len(quick_check_result.deviations) == 2
+    assert not quick_check_result.stopped_early
+
+
+def test_streamed_deviations_are_not_kept_in_memory(tmp_path):
+    exp_rows = [[f'g{record_no}', 'Global', '1', '1.0'] for record_no in range(100)]
+    act_rows = [[f'g{record_no}', 'Global', '2', '1.0'] for record_no in range(100)]
+    deviation_store = str(tmp_path / 'deviations.sqlite')
+    comparison_result, summary = compare(tmp_path, [(host_header, exp_rows)], [(host_header, act_rows)],
+                                         memory_budget=1000, deviation_store=deviation_store)
+    assert comparison_result.deviations == []
+    assert comparison_result.deviation_count == 100
+    assert comparison_result.count_deviations(column='Total Vulnerabilities') == 100
+    with compare_csv.DeviationStore(deviation_store) as store:
+        assert store.count_by('column') == {'Total Vulnerabilities': 100}
+        assert store.status is False
+
+
+def test_batch_command_line(tmp_path):
+    exp_rows = [['g1', 'Global', '1', '1.0'], ['g2', 'Global', '2', '1.0']]
+    act_rows = [['g1', 'Global', '1', '1.0'], ['g2', 'Global', '3', '1.0']]
+    for report_dir in ['expected', 'actual']:
+        (tmp_path / report_dir).mkdir()
+    for name, rows in [('same.csv', exp_rows), ('changed.csv', act_rows)]:
+        write_report(tmp_path / 'expected' / name, [(host_header, exp_rows)])
+        write_report(tmp_path / 'actual' / name, [(host_header, rows)])
+    index_file = tmp_path / 'index.csv'
+    assert compare_csv.main(['batch', '--expected-dir', str(tmp_path / 'expected'), '--actual-dir',
+                             str(tmp_path / 'actual'), str(tmp_path / 'summaries'), str(index_file)]) == 1
+    with open(index_file, newline='') as index:
+        statuses = {os.path.basename(row['Expected']): row['Status'] for row in csv.DictReader(index)}
+    assert statuses == {'same.csv': 'PASS', 'changed.csv': 'FAIL'}
+
+    manifest = tmp_path / 'pairs.json'
+    manifest.write_text(json.dumps([{'expected': str(tmp_path / 'expected' / 'same.csv'),
+                                     'actual': str(tmp_path / 'actual' / 'same.csv')}]))
+    assert compare_csv.main(['batch', '--manifest', str(manifest), str(tmp_path / 'summaries'), str(index_file),
+                             '--workers', '2', '--timeout', '60']) == 0
+
+
+def test_delta_state_does_not_reuse_paired_duplicate_records(tmp_path):
+    exp_rows = [['g1', 'Global', '1', '1.0'], ['g2', 'Global', '2', '1.0']]
+    expected = write_report(tmp_path / 'expected.csv', [(host_header, exp_rows)])
+    actual = tmp_path / 'actual.csv'
+    summary = str(tmp_path / 'summary.txt')
+    delta_state_dir = str(tmp_path / 'delta')
+    for act_rows in [[['g1', 'Global', '2', '1.0'], ['g1', 'Global', '1', '1.0'], ['g2', 'Global', '2', '1.0']],
+                     [['g1', 'Global', '2', '1.0'], ['g2', 'Global', '2', '1.0']]]:
+        write_report(actual, [(host_header, act_rows)])
+        comparison_result = compare_csv.validate_vm_report(expected, str(actual), summary,
+                                                           delta_state_dir=delta_state_dir)
+        assert not comparison_result
+    assert comparison_result.count_deviations(deviation_type='Column_Data_Deviation') == 1
+
+
+def test_identical_section_digest_uses_column_comparators(tmp_path):
+    column_specs_file = tmp_path / 'column_specs.json'
+    column_specs_file.write_text(json.dumps([{'name': 'last_scan', 'match_columns': ['Last Scan'], 'columns': {
+        'Last Scan': {'type': 'date', 'format': '%m/%d/%Y %H:%M'}, 'Comment': {'type': 'skip'}}}]))
+    header = host_header + ['Last Scan', 'Comment']
+    exp_rows = [['g1', 'Global', '1', '1.0', '01/01/2020 10:00', 'a'], ['g2', 'Global', '2', '1.0', '', 'b']]
+    act_rows = [['g1', 'Global', '1', '1.0', '01/01/2020 1 0:00', 'a'], ['g2', 'Global', '2', '1.0', '', 'b']]
+    comparison_result, summary = compare(tmp_path, [(header, exp_rows)], [(header, act_rows)],
+                                         column_specs_file=str(column_specs_file))
+    assert not comparison_result
+    assert comparison_result.count_deviations(column='Last Scan') == 1
+    # Skipped columns do not keep sections from being identical
+    act_rows = [exp_rows[0][:5] + ['c'], exp_rows[1][:5] + ['d']]
+    comparison_result, summary = compare(tmp_path, [(header, exp_rows)], [(header, act_rows)],
+                                         column_specs_file=str(column_specs_file), profile=True)
+    assert comparison_result
+    assert 'compare_report_data' not in {stage_record.stage for stage_record in comparison_result.stage_records}
+
+
+def test_report_chunks_skip_blank_lines_in_quoted_values(tmp_path, monkeypatch):
+    lines = ['Scan Results,2020-01-01', 'Company,Address', 'ACME,Street 1']
+    for section_no in range(4):
+        lines += ['', f'Name {section_no},IP,Severity,Comment', 'g0,1.1.1.0,5,12" disk']
+        lines += [f'g{record_no},1.1.1.{record_no},4,"line one\n\nline two {record_no}"'
+                  for record_no in range(1, 100)]
+    report = write_raw_report(tmp_path / 'report.csv', lines)
+    monkeypatch.setattr(compare_csv, 'large_report_size', 1000)
+    assert len(compare_csv.find_report_chunks(report, 4)) == 4
+    rpt_section_dict = compare_csv.read_report_sections_in_dict(report)
+    parallel_section_dict = compare_csv.read_reports_in_parallel([report], 4)[0]
+    assert list(parallel_section_dict) == list(rpt_section_dict)
+    for header_str_key, section_meta_data in rpt_section_dict.items():
+        assert parallel_section_dict[header_str_key] == section_meta_data
+
+
+def test_spilled_section_compares_like_in_memory(tmp_path):
+    exp_rows = [[f'g{record_no}', 'Global', '1', '1.0'] for record_no in range(200)]
+    act_rows = [[f'g{record_no}', 'Global', '2' if record_no % 50 == 0 else '1', '1.0'] for record_no in range(200)]
+    act_rows[10], act_rows[150] = act_rows[150], act_rows[10]
+    results = []
+    for options in [{}, {'memory_budget': 1000, 'keep_deviations': True}]:
+        comparison_result, summary = compare(tmp_path, [(host_header, exp_rows)], [(host_header, act_rows)],
+                                             **options)
+        results.append(comparison_result)
+    in_memory, spilled = results
+    assert not spilled
+    assert spilled.count_deviations(deviation_type='Sort_Order_Deviation') == 3
+    assert spilled.deviations == in_memory.deviations
+    assert (spilled.passed_checks, spilled.failed_checks) == (in_memory.passed_checks, in_memory.failed_checks)
+
+
+def test_spilled_sections_are_compared_in_chunks_within_budget():
+    stores = [compare_csv.SpillableRecordStore(10000) for _ in range(2)]
+    try:
+        for store in stores:
+            for record_no in range(1000):
+                store.add(f'g{record_no}', {'IP': f'g{record_no}', 'Network': 'Global'}, record_no + 5)
+        chunk_size = compare_csv._get_compare_chunk_size(*stores)
+        assert 0 < chunk_size < 1000
+        assert chunk_size * stores[0].spilled_record_size <= 10000
+        assert compare_csv._get_compare_chunk_size({}, {}) == compare_csv.compare_chunk_size
+    finally:
+        for store in stores:
+            store.close()
+
+
+def test_deviations_not_kept_are_queried_from_a_temporary_store(tmp_path):
+    exp_rows = [[f'g{record_no}', 'Global', '1', '1.0'] for record_no in range(100)]
+    act_rows = [[f'g{record_no}', 'Global', '2', '1.0'] for record_no in range(100)]
+    comparison_result, summary = compare(tmp_path, [(host_header, exp_rows)], [(host_header, act_rows)],
+                                         memory_budget=1000)
+    assert comparison_result.deviations == []
+    assert comparison_result.count_deviations(column='Total Vulnerabilities') == 100
+    assert comparison_result.is_deviation_present_for_data('Total Vulnerabilities')[0] is False
+    deviation_store = comparison_result.deviation_store
+    assert os.path.exists(deviation_store)
+    del comparison_result
+    assert not os.path.exists(deviation_store)
+
+
+def test_identical_reports_are_reported_and_skip_the_worker_pool(tmp_path, monkeypatch):
+    rows = [['g1', 'Global', '1', '1.0'], ['g2', 'Global', '2', '1.0']]
+    process_pools = []
+    create_process_pool = compare_csv._create_process_pool
+
+    def count_process_pools(workers):
+        process_pools.append(workers)
+        return create_process_pool(workers)
+
+    monkeypatch.setattr(compare_csv, '_create_process_pool', count_process_pools)
+    # Reports are read in a process pool unless they are streamed, sections of identical reports are not compared
+    for options, read_process_pools in [({'workers': 2}, 1), ({'workers': 2, 'memory_budget': 1000}, 0)]:
+        process_pools.clear()
+        comparison_result, summary = compare(tmp_path, [(host_header, rows)], [(host_header, rows)], **options)
+        assert len(process_pools) == read_process_pools
+        assert comparison_result.identical_data and comparison_result.to_dict()['identical_data']
+        with open(summary) as summary_file:
+            assert 'Expected and Actual reports have identical data' in summary_file.read()
+    comparison_result, summary = compare(tmp_path, [(host_header, rows)], [(host_header, rows[:1])])
+    assert not comparison_result.identical_data